@@ -7,3 +7,10 @@ and trying to correct coordinates in GIS data
 """
 from boundaries_algorithm import validation
 from boundaries_algorithm import visualization_module
+from boundaries_algorithm import equivalence_module
+from boundaries_algorithm import parallel_module
+from boundaries_algorithm import sweep_module
+from boundaries_algorithm import pipeline_module
+from boundaries_algorithm import streaming_module
+from boundaries_algorithm import store_module
+from boundaries_algorithm import reporting_module
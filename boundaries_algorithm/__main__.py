@@ -0,0 +1,7 @@
+"""
+Entry point of python -m boundaries_algorithm
+"""
+from boundaries_algorithm.cli_module import main
+
+if __name__ == "__main__":
+    main()
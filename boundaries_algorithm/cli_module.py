@@ -0,0 +1,548 @@
+"""
+A module with the command line interface of the pipeline
+
+Usage: python -m boundaries_algorithm --config config.json --stages all
+"""
+import argparse
+import json
+import os
+import warnings
+from functools import partial
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+
+from boundaries_algorithm.parallel_module import parallel_map
+from boundaries_algorithm.pipeline_module import (
+    DEFAULT_PARAMS,
+    STAGES,
+    run_partition,
+    run_partition_background,
+    split_partitions,
+    merge_results,
+    load_state,
+)
+from boundaries_algorithm.reporting_module import validation_report, compaction_report
+from boundaries_algorithm.store_module import read_meta, decode_keys
+from boundaries_algorithm.streaming_module import stream_validation
+from boundaries_algorithm.visualization_module import plot_folium, plot_folium_final
+
+STAGE_GROUPS = {
+    "build-polygons": ["init", "inter", "smooth", "compact"],
+    "validate-only": ["validate", "report"],
+    "all": STAGES + ["report", "render"],
+}
+
+# Polygons, trees and name of the map of every stage
+MAP_STAGES = {
+    "init": ("init_loc_hull", "init_loc_tree", "001_inicializacion"),
+    "inter": ("inter_loc_hull", "inter_loc_tree", "002_intersecciones"),
+    "smooth": ("smooth_loc_hull", "inter_loc_tree", "003_smooth"),
+    "compact": ("compact_loc_hull", "inter_loc_tree", "003_compact"),
+    "validate": ("smooth_loc_hull", "inter_loc_tree", "004_final"),
+}
+
+STAGE_CHOICES = STAGES + ["report", "render", "stream-validate"] + list(STAGE_GROUPS)
+
+DEFAULT_CONFIG = {
+    **DEFAULT_PARAMS,
+    "input": "data.csv",
+    "output_dir": "output",
+    "maps_dir": "maps",
+    "cache_dir": None,
+    "partition_column": None,
+    "crs_by_partition": None,
+    "executor": "process",
+    "max_workers": None,
+    "formats": ["csv"],
+    "stages": ["all"],
+    "resume": False,
+    "chunksize": 1_000_000,
+    "id_column": None,
+    "max_pending": 2,
+}
+
+
+def build_parser():
+    """Returns the argument parser of the command line interface
+
+    Parameters
+    ----------
+
+    Returns
+    -------
+    argparse.ArgumentParser
+
+    """
+    parser = argparse.ArgumentParser(
+        prog="boundaries_algorithm",
+        description="Builds zone polygons from coordinates and validates them",
+    )
+    parser.add_argument("--config", help="JSON file with the keys of DEFAULT_CONFIG")
+    parser.add_argument("--input", help="CSV or Parquet file with the points")
+    parser.add_argument("--output-dir", help="Directory of the exported files")
+    parser.add_argument("--maps-dir", help="Directory of the html maps")
+    parser.add_argument(
+        "--cache-dir",
+        help="Directory where polygons and trees are saved between stages",
+    )
+    parser.add_argument(
+        "--resume", action="store_true", default=None,
+        help="Skip the stages already saved in the cache directory",
+    )
+    parser.add_argument(
+        "--stages", nargs="+", choices=STAGE_CHOICES,
+        help="Stages to run (build-polygons, validate-only and all are groups)",
+    )
+    parser.add_argument("--column-id", help="Column with the zone of every point")
+    parser.add_argument("--actual-1", help="Latitude column")
+    parser.add_argument("--actual-2", help="Longitude column")
+    parser.add_argument("--convert-1", help="Projected X column to create")
+    parser.add_argument("--convert-2", help="Projected Y column to create")
+    parser.add_argument("--actual-epsg", help="CRS of the input coordinates")
+    parser.add_argument("--convert-epsg", help="Projected CRS")
+    parser.add_argument("--threshold-N", dest="threshold_N", type=float)
+    parser.add_argument("--buffer-area", type=float)
+    parser.add_argument("--N", dest="N", type=int, help="Points per smoothed boundary")
+    parser.add_argument("--epsilon", type=float, help="See polygons_init")
+    parser.add_argument("--batch-size", type=int, help="See mst_pruning")
+    parser.add_argument(
+        "--compact-tolerance", type=float,
+        help="Simplification tolerance of the polygons, see compact_polygons",
+    )
+    parser.add_argument(
+        "--max-vertices", type=int, help="Vertex budget per polygon, see compact_polygons"
+    )
+    parser.add_argument(
+        "--outlier-k", type=int, help="Neighbours of the outlier pre-filter, see mst_init"
+    )
+    parser.add_argument(
+        "--max-nodes", type=int, help="Sample budget per location, see mst_init"
+    )
+    parser.add_argument("--partition-column", help="Column to split the run, e.g. ciudad")
+    parser.add_argument(
+        "--crs-by-partition", choices=["utm"],
+        help="Projected CRS per partition (a dictionary can be given in --config)",
+    )
+    parser.add_argument("--executor", choices=["process", "thread", "serial"])
+    parser.add_argument("--max-workers", type=int)
+    parser.add_argument("--formats", nargs="+", choices=["csv", "parquet", "geojson"])
+    parser.add_argument(
+        "--chunksize", type=int, help="Rows per chunk of the stream-validate stage"
+    )
+    parser.add_argument("--id-column", help="Column with the id of the points")
+    parser.add_argument(
+        "--max-pending", type=int,
+        help="Maps and exports waiting in the background while the next stages "
+        "compute, 0 writes them at the end",
+    )
+    return parser
+
+
+def parse_config(argv=None):
+    """Returns the configuration from defaults, config file and flags,
+    in increasing priority
+
+    Parameters
+    ----------
+    argv : list of str, optional
+        Command line arguments, sys.argv if None
+
+    Returns
+    -------
+    dict
+
+    """
+    args = vars(build_parser().parse_args(argv))
+    config = {**DEFAULT_CONFIG}
+    config["init_options"] = dict(config["init_options"])
+    config["inter_options"] = dict(config["inter_options"])
+    config["compact_options"] = dict(config["compact_options"])
+    if args["config"] is not None:
+        with open(args["config"]) as file:
+            config.update(json.load(file))
+    epsilon = args.pop("epsilon")
+    batch_size = args.pop("batch_size")
+    outlier_k = args.pop("outlier_k")
+    max_nodes = args.pop("max_nodes")
+    compact_tolerance = args.pop("compact_tolerance")
+    max_vertices = args.pop("max_vertices")
+    config.update({key: value for key, value in args.items() if value is not None})
+    if epsilon is not None:
+        config["init_options"]["epsilon"] = epsilon
+    if batch_size is not None:
+        config["init_options"]["batch_size"] = batch_size
+        config["inter_options"]["batch_size"] = batch_size
+    if outlier_k is not None:
+        config["init_options"]["outlier_k"] = outlier_k
+    if max_nodes is not None:
+        config["init_options"]["max_nodes"] = max_nodes
+    if compact_tolerance is not None:
+        config["compact_options"]["tolerance"] = compact_tolerance
+    if max_vertices is not None:
+        config["compact_options"]["max_vertices"] = max_vertices
+    if config["executor"] == "serial":
+        config["executor"] = None
+    return config
+
+
+def expand_stages(stages):
+    """Returns the stages of a list that may contain groups
+
+    Parameters
+    ----------
+    stages : list of str
+        Stages and groups of STAGE_GROUPS
+
+    Returns
+    -------
+    list of str
+
+    """
+    expanded = []
+    for stage in stages:
+        expanded += STAGE_GROUPS.get(stage, [stage])
+    return expanded
+
+
+def read_points(path):
+    """Reads a CSV or Parquet file of points
+
+    Parameters
+    ----------
+    path : str
+        Path of the file
+
+    Returns
+    -------
+    pandas.core.frame.DataFrame
+
+    """
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path)
+    return pd.read_csv(path)
+
+
+def render_stage(result, stage, config, partition=None):
+    """Saves the map of a stage of a partition result
+
+    Parameters
+    ----------
+    result : dict
+        Output of run_partition, or of run_pipeline up to the stage
+    stage : str
+        Stage of MAP_STAGES
+    config : dict
+        Configuration, see parse_config
+    partition : optional
+        Key of the partition, added to the name of the map
+
+    Returns
+    -------
+
+
+    """
+    hull, tree, name = MAP_STAGES[stage]
+    if stage == "validate" and "compact_loc_hull" in result:
+        # Polygons used in the validation
+        hull = "compact_loc_hull"
+    if hull not in result or tree not in result:
+        return
+    if stage == "validate" and "df_good" not in result:
+        return
+    suffix = "" if partition is None else f"_{partition}"
+    options = dict(
+        actual_epsg=config["actual_epsg"],
+        convert_epsg=result["crs"],
+        column_id=config["column_id"],
+        actual_1=config["actual_1"],
+        actual_2=config["actual_2"],
+        path=config["maps_dir"],
+    )
+    os.makedirs(config["maps_dir"], exist_ok=True)
+    if stage == "validate":
+        plot_folium_final(
+            loc_hull=result[hull],
+            loc_tree=result[tree],
+            df=result["df"],
+            df_good=result["df_good"],
+            df_bad=result["df_bad"],
+            name=name + suffix,
+            **options,
+        )
+    else:
+        plot_folium(
+            loc_hull=result[hull], loc_tree=result[tree], df=result["df"],
+            name=name + suffix, **options
+        )
+
+
+def render_maps(result, config):
+    """Saves the maps of the stages available in a partition result
+
+    Parameters
+    ----------
+    result : dict
+        Output of run_partition
+    config : dict
+        Configuration, see parse_config
+
+    Returns
+    -------
+
+
+    """
+    for stage in MAP_STAGES:
+        render_stage(result, stage, config, result["partition"])
+
+
+def validated_df(result):
+    """Returns the projected DataFrame with the Validado column
+
+    Parameters
+    ----------
+    result : dict
+        Output of run_pipeline or merge_results with the validate stage
+
+    Returns
+    -------
+    pandas.core.frame.DataFrame
+
+    """
+    df = result["df"].copy()
+    df["Validado"] = np.where(result["valid"], "SI", "NO")
+    return df
+
+
+def summary(result, columns, hull_columns=None):
+    """Returns the number of good and bad points and the polygon area
+    per group, see validation_report. The areas are those of the polygons
+    used in the validation, compacted if the compact stage ran
+
+    Parameters
+    ----------
+    result : dict
+        Output of run_pipeline or merge_results with the validate stage
+    columns : list of str
+        Columns used to group the points (e.g. partition and location)
+    hull_columns : list of str, optional
+        Names of the parts of the keys of the polygons, columns if None
+
+    Returns
+    -------
+    pandas.core.frame.DataFrame
+
+    """
+    loc_hull = result.get("compact_loc_hull", result.get("smooth_loc_hull"))
+    resumen = validation_report(result["df"], result["valid"], columns, loc_hull, hull_columns)
+    return resumen
+
+
+def export_results(result, config):
+    """Saves the validated points and the smoothed (and compacted) polygons
+
+    Parameters
+    ----------
+    result : dict
+        Output of run_pipeline or merge_results
+    config : dict
+        Configuration, see parse_config
+
+    Returns
+    -------
+
+
+    """
+    os.makedirs(config["output_dir"], exist_ok=True)
+    path = os.path.join(config["output_dir"], "validacion")
+    if "df_good" in result:
+        df = validated_df(result)
+        if "csv" in config["formats"]:
+            df.to_csv(path + ".csv")
+        if "parquet" in config["formats"]:
+            df.to_parquet(path + ".parquet")
+    if "geojson" not in config["formats"]:
+        return
+    # The full polygons and, if compact ran, the compacted ones
+    for hull, name in [("smooth_loc_hull", "poligonos"), ("compact_loc_hull", "poligonos_compactos")]:
+        if hull not in result:
+            continue
+        crs = result["crs"]
+        frames = []
+        for key, polygon in result[hull].items():
+            partition, loc = key if isinstance(crs, dict) else (None, key)
+            gs = gpd.GeoSeries([polygon], crs=crs[partition] if isinstance(crs, dict) else crs)
+            frames.append(
+                gpd.GeoDataFrame(
+                    {"partition": [partition], config["column_id"]: [loc]},
+                    geometry=gs.to_crs(config["actual_epsg"]).values,
+                    crs=config["actual_epsg"],
+                )
+            )
+        gdf = pd.concat(frames, ignore_index=True)
+        gdf.to_file(os.path.join(config["output_dir"], name + ".geojson"), driver="GeoJSON")
+
+
+def cached_polygons(config):
+    """Returns the polygons used in the validation (compacted if the
+    compact stage ran, smoothed otherwise) and CRSs saved in the cache
+    directory
+
+    Parameters
+    ----------
+    config : dict
+        Configuration, see parse_config
+
+    Returns
+    -------
+    tuple
+        (loc_hull, crs) as expected by stream_validation
+
+    """
+    if config["partition_column"] is None:
+        state = load_state(os.path.join(config["cache_dir"], "pipeline"))
+        return state.get("compact_loc_hull", state["smooth_loc_hull"]), state["crs"]
+    loc_hull = {}
+    crs = {}
+    for partition in sorted(os.listdir(config["cache_dir"])):
+        path = os.path.join(config["cache_dir"], partition)
+        if not os.path.exists(os.path.join(path, "meta.json")):
+            continue
+        state = load_state(path)
+        # Same type as in the input (e.g. numeric city codes)
+        partition = decode_keys([read_meta(path).get("partition", partition)])[0]
+        crs[partition] = state["crs"]
+        for loc, hull in state.get("compact_loc_hull", state["smooth_loc_hull"]).items():
+            loc_hull[(partition, loc)] = hull
+    return loc_hull, crs
+
+
+def stream_stage(config):
+    """Validates the input file by chunks against the cached polygons
+
+    Parameters
+    ----------
+    config : dict
+        Configuration, see parse_config
+
+    Returns
+    -------
+    pandas.core.frame.DataFrame
+        Summary of validation, see stream_validation
+
+    """
+    loc_hull, crs = cached_polygons(config)
+    os.makedirs(config["output_dir"], exist_ok=True)
+    extension = ".parquet" if "parquet" in config["formats"] else ".csv"
+    resumen = stream_validation(
+        input_path=config["input"],
+        output_path=os.path.join(config["output_dir"], "validacion" + extension),
+        main_loc_hull=loc_hull,
+        crs=crs,
+        column_id=config["column_id"],
+        actual_epsg=config["actual_epsg"],
+        actual_1=config["actual_1"],
+        actual_2=config["actual_2"],
+        id_column=config["id_column"],
+        partition_column=config["partition_column"],
+        chunksize=config["chunksize"],
+    )
+    return resumen
+
+
+def main(argv=None):
+    """Runs the selected stages of the pipeline
+
+    Parameters
+    ----------
+    argv : list of str, optional
+        Command line arguments, sys.argv if None
+
+    Returns
+    -------
+
+
+    """
+    warnings.simplefilter("ignore")
+    config = parse_config(argv)
+    stages = expand_stages(config["stages"])
+    pipeline_stages = [stage for stage in STAGES if stage in stages]
+    if pipeline_stages and pipeline_stages[0] != "init" and config["cache_dir"] is None:
+        raise ValueError("cache_dir is needed to run stages without init")
+    if "stream-validate" in stages:
+        if config["cache_dir"] is None:
+            raise ValueError("cache_dir is needed to run stream-validate")
+        print(stream_stage(config))
+        if set(stages) == {"stream-validate"}:
+            return
+    if config["cache_dir"] is not None:
+        os.makedirs(config["cache_dir"], exist_ok=True)
+    df = read_points(config["input"])
+    if config["partition_column"] is None:
+        items = [(None, df)]
+    else:
+        items = split_partitions(df, config["partition_column"])
+    params = {key: config[key] for key in DEFAULT_PARAMS}
+    # The full polygons are only validated again for the report
+    params["compact_report"] = "report" in stages
+    options = dict(
+        crs_by_partition=config["crs_by_partition"],
+        stages=pipeline_stages,
+        cache_dir=config["cache_dir"],
+        resume=config["resume"],
+        **params,
+    )
+    # Maps and exports of a single plane are written while the next
+    # stages compute
+    background = (
+        config["partition_column"] is None
+        and config["executor"] is not None
+        and config["max_pending"] > 0
+    )
+    stage_tasks = {}
+    if background and "render" in stages:
+        for stage in pipeline_stages:
+            stage_tasks[stage] = [partial(render_stage, stage=stage, config=config)]
+    if background and "validate" in pipeline_stages:
+        stage_tasks["validate"] = stage_tasks.get("validate", []) + [
+            partial(export_results, config=config)
+        ]
+    if stage_tasks:
+        results = [
+            run_partition_background(
+                items[0], stage_tasks, config["executor"], config["max_workers"] or 1,
+                config["max_pending"], **options
+            )
+        ]
+    else:
+        results = parallel_map(
+            partial(run_partition, **options),
+            items,
+            config["executor"],
+            config["max_workers"],
+        )
+    result = results[0] if config["partition_column"] is None else merge_results(results)
+    if "report" in stages and "df_good" in result:
+        print("-" * 12 + " RESUMEN " + "-" * 12)
+        columns = [config["partition_column"], config["column_id"]]
+        columns = [column for column in columns if column is not None]
+        print(summary(result, columns))
+        if config["partition_column"] is not None:
+            print(summary(result, [config["partition_column"]], columns))
+        if "full_valid" in result:
+            print("-" * 10 + " COMPACTACIÓN " + "-" * 10)
+            print(
+                compaction_report(
+                    result["df"], result["valid"], result["full_valid"], columns,
+                    result["smooth_loc_hull"], result["compact_loc_hull"]
+                ).to_string()
+            )
+        print("-" * 34)
+    if "validate" not in stage_tasks:
+        export_results(result, config)
+    if "render" in stages:
+        for partition_result in results:
+            for stage in MAP_STAGES:
+                # Maps of stages loaded from the cache
+                if stage not in stage_tasks:
+                    render_stage(partition_result, stage, config, partition_result["partition"])
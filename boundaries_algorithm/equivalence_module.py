@@ -0,0 +1,361 @@
+"""
+A module for checking the equivalence between the reference
+pipeline and alternate (accelerated) engines
+"""
+from functools import partial
+import numpy as np
+import pandas as pd
+
+from boundaries_algorithm.validation.np_module import coreset_cell_size
+from boundaries_algorithm.validation.validation import (
+    polygons_init,
+    poly_no_inter,
+    smooth_polygons,
+    ident_good_proj,
+)
+
+REFERENCE_ENGINE = {
+    "polygons_init": polygons_init,
+    "poly_no_inter": poly_no_inter,
+    "smooth_polygons": smooth_polygons,
+    "ident_good_proj": ident_good_proj,
+}
+
+
+def random_zones_df(
+    n_zones, n_points, seed=None, spread=1000.0, separation=4000.0,
+    outlier_fraction=0.02, duplicate_fraction=0.1, column_id="zona",
+    convert_1="X", convert_2="Y"
+):
+    """Returns a random DataFrame of projected points grouped in zones
+
+    Zones are gaussian clouds whose centers lie on a grid, with a fraction
+    of duplicated coordinates and a fraction of far away outliers, which
+    emulates the output of a geocoder
+
+    Parameters
+    ----------
+    n_zones : int
+        Number of zones
+    n_points : int
+        Number of points per zone
+    seed : int
+        Seed of the random generator
+    spread : float
+        Standard deviation of the points around the zone center
+    separation : float
+        Distance between zone centers
+    outlier_fraction : float
+        Fraction of points that are moved far away from their zone
+    duplicate_fraction : float
+        Fraction of points that copy the coordinates of another point
+        of the same zone
+
+    Returns
+    -------
+    pandas.core.frame.DataFrame
+        DataFrame with column_id, convert_1 and convert_2 columns
+
+    """
+    rng = np.random.default_rng(seed)
+    side = int(np.ceil(np.sqrt(n_zones)))
+    frames = []
+    for zone in range(n_zones):
+        center = separation * np.array([zone % side, zone // side])
+        xy = center + rng.normal(0, spread, size=(n_points, 2))
+        n_dup = int(duplicate_fraction * n_points)
+        if n_dup > 0:
+            src = rng.integers(0, n_points, n_dup)
+            dst = rng.integers(0, n_points, n_dup)
+            xy[dst] = xy[src]
+        n_out = int(outlier_fraction * n_points)
+        if n_out > 0:
+            out = rng.integers(0, n_points, n_out)
+            xy[out] += rng.normal(0, 10 * separation, size=(n_out, 2))
+        frames.append(
+            pd.DataFrame(
+                {column_id: f"zona_{zone}", convert_1: xy[:, 0], convert_2: xy[:, 1]}
+            )
+        )
+    main_df = pd.concat(frames, ignore_index=True)
+    return main_df
+
+
+def run_engine(
+    main_df, engine, column_id, threshold_N, buffer_area, N, convert_1, convert_2
+):
+    """Runs the four stages of the pipeline with the functions of an engine
+
+    Parameters
+    ----------
+    main_df : pandas.core.frame.DataFrame
+        DataFrame with projected coordinates
+    engine : dict
+        Dictionary with the keys of REFERENCE_ENGINE and functions with
+        the same signature as values. Missing keys fall back to the
+        reference functions
+
+    Returns
+    -------
+    dict
+        Dictionary with the output of every stage
+
+    """
+    stages = {**REFERENCE_ENGINE, **engine}
+    init_loc_hull, init_loc_tree = stages["polygons_init"](
+        main_df=main_df,
+        column_id=column_id,
+        threshold_N=threshold_N,
+        buffer_area=buffer_area,
+        convert_1=convert_1,
+        convert_2=convert_2,
+    )
+    inter_loc_hull, inter_loc_tree = stages["poly_no_inter"](
+        main_loc_hull=init_loc_hull, main_loc_tree=init_loc_tree
+    )
+    smooth_loc_hull = stages["smooth_polygons"](main_loc_hull=inter_loc_hull, N=N)
+    df_good, df_bad, percentage = stages["ident_good_proj"](
+        main_df=main_df,
+        main_loc_hull=smooth_loc_hull,
+        column_id=column_id,
+        convert_1=convert_1,
+        convert_2=convert_2,
+    )
+    return {
+        "init": init_loc_hull,
+        "inter": inter_loc_hull,
+        "smooth": smooth_loc_hull,
+        "good": df_good.index,
+        "percentage": percentage,
+    }
+
+
+def compare_loc_hull(ref_loc_hull, alt_loc_hull, area_tol=1e-6, hausdorff_tol=1e-6):
+    """Compares two dictionaries of polygons key by key
+
+    Parameters
+    ----------
+    ref_loc_hull : dict with values as shapely.geometry.polygon.Polygon
+        Polygons of the reference engine
+    alt_loc_hull : dict with values as shapely.geometry.polygon.Polygon
+        Polygons of the alternate engine
+    area_tol : float
+        Maximum accepted symmetric difference area relative to the
+        reference polygon area
+    hausdorff_tol : float
+        Maximum accepted Hausdorff distance in CRS units
+
+    Returns
+    -------
+    pandas.core.frame.DataFrame
+        DataFrame indexed by location with the symmetric difference area,
+        the relative area, the Hausdorff distance and an ok flag
+
+    """
+    rows = {}
+    for key in set(ref_loc_hull) | set(alt_loc_hull):
+        ref = ref_loc_hull.get(key)
+        alt = alt_loc_hull.get(key)
+        if ref is None or alt is None:
+            rows[key] = (np.nan, np.nan, np.nan, False)
+            continue
+        sym_area = ref.symmetric_difference(alt).area
+        rel_area = sym_area / ref.area if ref.area > 0 else sym_area
+        hausdorff = ref.hausdorff_distance(alt)
+        ok = rel_area <= area_tol and hausdorff <= hausdorff_tol
+        rows[key] = (sym_area, rel_area, hausdorff, ok)
+    report = pd.DataFrame.from_dict(
+        rows,
+        orient="index",
+        columns=["sym_diff_area", "rel_sym_diff_area", "hausdorff", "ok"],
+    )
+    return report
+
+
+def compare_classification(index, ref_good, alt_good):
+    """Compares the good/bad classification of two engines
+
+    Parameters
+    ----------
+    index : pandas.core.indexes.base.Index
+        Index of all the evaluated nodes
+    ref_good : array-like
+        Nodes classified as good by the reference engine
+    alt_good : array-like
+        Nodes classified as good by the alternate engine
+
+    Returns
+    -------
+    pandas.core.indexes.base.Index
+        Nodes that have a different classification
+
+    """
+    ref_mask = index.isin(ref_good)
+    alt_mask = index.isin(alt_good)
+    mismatches = index[ref_mask != alt_mask]
+    return mismatches
+
+
+def differential_run(
+    main_df, alt_engine, column_id, threshold_N, buffer_area, N, convert_1,
+    convert_2, ref_engine=REFERENCE_ENGINE, area_tol=1e-6, hausdorff_tol=1e-6,
+    mismatch_tol=0.0
+):
+    """Runs the reference and the alternate engine side by side and
+    reports their differences
+
+    Parameters
+    ----------
+    main_df : pandas.core.frame.DataFrame
+        DataFrame with projected coordinates
+    alt_engine : dict
+        Engine to be checked, see run_engine
+    ref_engine : dict
+        Engine used as reference
+    area_tol : float
+        See compare_loc_hull
+    hausdorff_tol : float
+        See compare_loc_hull
+    mismatch_tol : float
+        Maximum accepted fraction of nodes with different classification
+
+    Returns
+    -------
+    dict
+        Dictionary with a polygon report per stage, the classification
+        mismatches and a passed flag
+
+    """
+    params = dict(
+        column_id=column_id,
+        threshold_N=threshold_N,
+        buffer_area=buffer_area,
+        N=N,
+        convert_1=convert_1,
+        convert_2=convert_2,
+    )
+    ref = run_engine(main_df, ref_engine, **params)
+    alt = run_engine(main_df, alt_engine, **params)
+    report = {
+        stage: compare_loc_hull(ref[stage], alt[stage], area_tol, hausdorff_tol)
+        for stage in ["init", "inter", "smooth"]
+    }
+    mismatches = compare_classification(main_df.index, ref["good"], alt["good"])
+    mismatch_rate = mismatches.size / main_df.shape[0]
+    report["mismatches"] = mismatches
+    report["mismatch_rate"] = mismatch_rate
+    report["passed"] = (
+        all(report[stage]["ok"].all() for stage in ["init", "inter", "smooth"])
+        and mismatch_rate <= mismatch_tol
+    )
+    return report
+
+
+def differential_suite(
+    alt_engine, column_id, threshold_N, buffer_area, N, convert_1, convert_2,
+    recorded=(), seeds=(), n_zones=4, n_points=60, **tolerances
+):
+    """Runs differential_run over recorded DataFrames and randomized ones
+
+    Parameters
+    ----------
+    alt_engine : dict
+        Engine to be checked, see run_engine
+    recorded : iterable of pandas.core.frame.DataFrame
+        Recorded inputs with projected coordinates
+    seeds : iterable of int
+        Seeds of the randomized inputs generated with random_zones_df
+    tolerances :
+        Keyword arguments passed to differential_run
+
+    Returns
+    -------
+    pandas.core.frame.DataFrame
+        DataFrame with one row per input summarizing the worst differences
+
+    """
+    inputs = {f"recorded_{i}": df for i, df in enumerate(recorded)}
+    inputs.update(
+        {
+            f"seed_{seed}": random_zones_df(
+                n_zones, n_points, seed=seed, column_id=column_id,
+                convert_1=convert_1, convert_2=convert_2
+            )
+            for seed in seeds
+        }
+    )
+    rows = {}
+    for name, main_df in inputs.items():
+        report = differential_run(
+            main_df, alt_engine, column_id, threshold_N, buffer_area, N,
+            convert_1, convert_2, **tolerances
+        )
+        rows[name] = {
+            "max_rel_sym_diff_area": max(
+                report[stage]["rel_sym_diff_area"].max() for stage in ["init", "inter", "smooth"]
+            ),
+            "max_hausdorff": max(
+                report[stage]["hausdorff"].max() for stage in ["init", "inter", "smooth"]
+            ),
+            "mismatch_rate": report["mismatch_rate"],
+            "passed": report["passed"],
+        }
+    summary = pd.DataFrame.from_dict(rows, orient="index")
+    return summary
+
+
+def coreset_report(
+    main_df, max_nodes, column_id, threshold_N, buffer_area, N, convert_1,
+    convert_2, epsilon=0.0, **tolerances
+):
+    """Reports the error of the sample budget of polygons_init (see
+    mst_init) versus the exact path
+
+    The error bound only holds for the hulls of the unpruned trees,
+    pruning and poly_no_inter may choose other nodes and amplify the
+    differences, which the polygon reports of every stage measure
+
+    Parameters
+    ----------
+    main_df : pandas.core.frame.DataFrame
+        DataFrame with projected coordinates
+    max_nodes : int
+        Sample budget per location
+    epsilon : float
+        Collapse of coincident nodes used by both paths
+    tolerances :
+        Keyword arguments passed to differential_run
+
+    Returns
+    -------
+    dict
+        Output of differential_run with the error bound of every
+        location (error_bound) and the cell sides (cell_size)
+
+    """
+    params = dict(
+        column_id=column_id,
+        threshold_N=threshold_N,
+        buffer_area=buffer_area,
+        N=N,
+        convert_1=convert_1,
+        convert_2=convert_2,
+    )
+    report = differential_run(
+        main_df,
+        {"polygons_init": partial(polygons_init, epsilon=epsilon, max_nodes=max_nodes)},
+        ref_engine={**REFERENCE_ENGINE, "polygons_init": partial(polygons_init, epsilon=epsilon)},
+        **params,
+        **tolerances,
+    )
+    cell_size = pd.Series(
+        {
+            loc: coreset_cell_size(
+                sub_df[convert_1].values, sub_df[convert_2].values, max_nodes, epsilon
+            )
+            for loc, sub_df in main_df.groupby(column_id)
+        }
+    )
+    report["cell_size"] = cell_size
+    report["error_bound"] = np.sqrt(2) * cell_size
+    return report
@@ -0,0 +1,101 @@
+"""
+A module for running pipeline tasks in parallel
+"""
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+
+EXECUTORS = {
+    "process": ProcessPoolExecutor,
+    "thread": ThreadPoolExecutor,
+}
+
+
+def parallel_map(function, items, executor="process", max_workers=None):
+    """Applies a function to every item using a pool of workers
+
+    Parameters
+    ----------
+    function : function
+        Function of one argument. With the process executor it must be
+        picklable (e.g. a module function or a functools.partial of one)
+    items : iterable
+        Arguments of the function
+    executor : str or None
+        "process", "thread" or None to run serially in this process
+    max_workers : int, optional
+        Number of workers of the pool
+
+    Returns
+    -------
+    list
+        Results in the same order as items
+
+    """
+    if executor is None or max_workers == 1:
+        return [function(item) for item in items]
+    if executor not in EXECUTORS:
+        raise ValueError(f"executor must be one of {list(EXECUTORS)} or None")
+    with EXECUTORS[executor](max_workers=max_workers) as pool:
+        results = list(pool.map(function, items))
+    return results
+
+
+def submit_bounded(pool, pending, function, *args, max_pending=2, **kwargs):
+    """Submits a task to a pool after waiting until fewer than max_pending
+    submitted tasks are unfinished
+
+    Bounding the queue keeps the memory of the arguments of the waiting
+    tasks bounded when tasks are submitted faster than they finish
+
+    Parameters
+    ----------
+    pool : concurrent.futures.Executor
+        Pool of workers, see EXECUTORS
+    pending : set of concurrent.futures.Future
+        Unfinished tasks, updated in place
+    function : function
+        Task. With the process executor it must be picklable
+    args :
+        Positional arguments of the task
+    max_pending : int
+        Maximum number of unfinished tasks
+    kwargs :
+        Keyword arguments of the task
+
+    Returns
+    -------
+    concurrent.futures.Future
+
+    """
+    while len(pending) >= max(max_pending, 1):
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            pending.remove(future)
+            # Errors of the task are raised here
+            future.result()
+    future = pool.submit(function, *args, **kwargs)
+    pending.add(future)
+    return future
+
+
+def wait_all(pending):
+    """Waits until all the submitted tasks finish
+
+    Parameters
+    ----------
+    pending : set of concurrent.futures.Future
+        Unfinished tasks, see submit_bounded. Emptied in place
+
+    Returns
+    -------
+    list
+        Results of the tasks
+
+    """
+    results = [future.result() for future in wait(pending).done]
+    pending.clear()
+    return results
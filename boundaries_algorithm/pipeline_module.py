@@ -0,0 +1,662 @@
+"""
+A module for running the whole pipeline, on a single plane
+or partitioned by a column (e.g. by city)
+"""
+import os
+from functools import partial
+import numpy as np
+import pandas as pd
+
+from boundaries_algorithm.parallel_module import (
+    EXECUTORS,
+    parallel_map,
+    submit_bounded,
+    wait_all,
+)
+from boundaries_algorithm.preprocessing_module import (
+    coordinates_projection,
+    utm_epsg,
+)
+from boundaries_algorithm.store_module import (
+    read_meta,
+    update_meta,
+    write_array,
+    read_array,
+    write_points,
+    write_hulls,
+    read_hulls,
+    write_trees,
+    read_trees,
+    mark_stage,
+    completed_stages,
+    has_checkpoint,
+    remove_checkpoint,
+    encode_keys,
+)
+from boundaries_algorithm.validation.validation import (
+    polygons_init,
+    poly_no_inter,
+    smooth_polygons,
+    compact_polygons,
+    ident_good_mask,
+    tree_outliers,
+)
+
+DEFAULT_PARAMS = {
+    "actual_epsg": "epsg:4686",
+    "convert_epsg": "epsg:3116",
+    "column_id": "zona",
+    "actual_1": "latitud",
+    "actual_2": "longitud",
+    "convert_1": "X",
+    "convert_2": "Y",
+    "threshold_N": 0.90,
+    "buffer_area": 0.15,
+    "N": 100,
+    # Keyword arguments of polygons_init, poly_no_inter and compact_polygons
+    "init_options": {},
+    "inter_options": {},
+    "compact_options": {},
+    # Validate also with the full polygons when compact runs
+    "compact_report": False,
+}
+
+STAGES = ["init", "inter", "smooth", "compact", "validate"]
+
+# Outputs of every stage, the outputs of a stage and of the following
+# ones are dropped when it runs again
+STAGE_OUTPUTS = {
+    "init": ["init_loc_hull", "init_loc_tree"],
+    "inter": ["inter_loc_hull", "inter_loc_tree"],
+    "smooth": ["smooth_loc_hull"],
+    "compact": ["compact_loc_hull"],
+    "validate": ["valid", "full_valid"],
+}
+
+STATE_KEYS = [
+    "init_loc_hull",
+    "init_loc_tree",
+    "inter_loc_hull",
+    "inter_loc_tree",
+    "smooth_loc_hull",
+    "compact_loc_hull",
+]
+
+
+def first_stage(stages):
+    """Returns the position in STAGES of the first stage of a list
+
+    Parameters
+    ----------
+    stages : list of str
+        Stages of STAGES
+
+    Returns
+    -------
+    int
+        len(STAGES) if no stage of STAGES is in the list
+
+    """
+    first = min([STAGES.index(stage) for stage in stages if stage in STAGES], default=len(STAGES))
+    return first
+
+
+def run_pipeline(main_df, stages=STAGES, state=None, on_stage=None, **params):
+    """Runs projection, polygons_init, poly_no_inter, smooth_polygons,
+    compact_polygons and ident_good_proj over a DataFrame
+
+    The compact stage only runs when compact_options are given, and then
+    the nodes are validated with the compacted polygons
+
+    Parameters
+    ----------
+    main_df : pandas.core.frame.DataFrame
+        DataFrame with geographic coordinates
+    stages : list of str
+        Stages of STAGES to run. The projection always runs
+    state : dict, optional
+        Output of a previous run (e.g. loaded with load_state) with the
+        inputs of the first stage that runs. A saved validity (valid) is
+        used when the validate stage does not run
+    on_stage : function, optional
+        Function of (stage, result) called after every stage that runs,
+        e.g. to render or export its output while the next stages
+        compute (see run_partition_background)
+    params :
+        Keyword arguments overriding DEFAULT_PARAMS
+
+    Returns
+    -------
+    dict
+        Dictionary with the projected DataFrame (df), the polygons and
+        trees of every stage (init_loc_hull, init_loc_tree, inter_loc_hull,
+        inter_loc_tree, smooth_loc_hull, compact_loc_hull), the validation
+        (df_good, df_bad, percentage and the boolean mask valid aligned
+        with df, and full_valid with the full polygons if compact_report)
+        and the projected CRS (crs)
+
+    """
+    params = {**DEFAULT_PARAMS, **params}
+    result = {} if state is None else dict(state)
+    for stage in STAGES[first_stage(stages):]:
+        for key in STAGE_OUTPUTS[stage]:
+            result.pop(key, None)
+    result["df"] = coordinates_projection(
+        main_df=main_df,
+        actual_epsg=params["actual_epsg"],
+        convert_epsg=params["convert_epsg"],
+        actual_1=params["actual_1"],
+        actual_2=params["actual_2"],
+        convert_1=params["convert_1"],
+        convert_2=params["convert_2"],
+    )
+    result["crs"] = params["convert_epsg"]
+    if "init" in stages:
+        result["init_loc_hull"], result["init_loc_tree"] = polygons_init(
+            main_df=result["df"],
+            column_id=params["column_id"],
+            threshold_N=params["threshold_N"],
+            buffer_area=params["buffer_area"],
+            convert_1=params["convert_1"],
+            convert_2=params["convert_2"],
+            **params["init_options"],
+        )
+        if on_stage is not None:
+            on_stage("init", result)
+    if "inter" in stages:
+        result["inter_loc_hull"], result["inter_loc_tree"] = poly_no_inter(
+            main_loc_hull=result["init_loc_hull"],
+            main_loc_tree=result["init_loc_tree"],
+            **params["inter_options"],
+        )
+        if on_stage is not None:
+            on_stage("inter", result)
+    if "smooth" in stages:
+        result["smooth_loc_hull"] = smooth_polygons(
+            main_loc_hull=result["inter_loc_hull"], N=params["N"]
+        )
+        if on_stage is not None:
+            on_stage("smooth", result)
+    if "compact" in stages:
+        if params["compact_options"]:
+            result["compact_loc_hull"] = compact_polygons(
+                main_loc_hull=result["smooth_loc_hull"], **params["compact_options"]
+            )
+        if on_stage is not None:
+            on_stage("compact", result)
+    if "validate" in stages:
+        validate = partial(
+            ident_good_mask,
+            main_df=result["df"],
+            column_id=params["column_id"],
+            convert_1=params["convert_1"],
+            convert_2=params["convert_2"],
+            exclude=tree_outliers(result["init_loc_tree"]) if "init_loc_tree" in result else None,
+        )
+        result["valid"] = validate(
+            main_loc_hull=result.get("compact_loc_hull", result["smooth_loc_hull"])
+        )
+        if params["compact_report"] and "compact_loc_hull" in result:
+            result["full_valid"] = validate(main_loc_hull=result["smooth_loc_hull"])
+    if "valid" in result:
+        # Same outputs as ident_good_proj
+        valid = result["valid"]
+        result["df_good"] = result["df"].loc[valid]
+        result["df_bad"] = result["df"].loc[~valid]
+        result["percentage"] = round(100 * valid.sum() / valid.size, 2)
+    if "validate" in stages and on_stage is not None:
+        on_stage("validate", result)
+    return result
+
+
+def save_stage(path, stage, state):
+    """Saves the outputs of a finished stage in a columnar store
+
+    Parameters
+    ----------
+    path : str
+        Directory of the store, see store_module
+    stage : str
+        Stage of STAGES
+    state : dict
+        Output of run_pipeline after the stage
+
+    Returns
+    -------
+
+    
+    """
+    for key in STAGE_OUTPUTS[stage]:
+        if key not in state:
+            continue
+        if key.endswith("_loc_hull"):
+            write_hulls(path, key, state[key])
+        elif key.endswith("_loc_tree"):
+            write_trees(path, key, state[key])
+        elif key == "valid":
+            write_array(path, "valid", state["valid"])
+
+
+def clear_stages(path, first):
+    """Drops from a store the stages from a position of STAGES on and
+    their outputs, since they must run again
+
+    Parameters
+    ----------
+    path : str
+        Directory of the store
+    first : int
+        Position in STAGES of the first stage to drop, see first_stage
+
+    Returns
+    -------
+
+    
+    """
+    meta = read_meta(path)
+    update_meta(
+        path,
+        stages=[
+            stage for stage in meta["stages"] if stage in STAGES and STAGES.index(stage) < first
+        ],
+    )
+    for stage in STAGES[first:]:
+        for key in STAGE_OUTPUTS[stage]:
+            if meta.get(key) is not None:
+                update_meta(path, **{key: None})
+    if first <= STAGES.index("validate") and os.path.exists(os.path.join(path, "valid.npy")):
+        # Validity of previous polygons
+        os.remove(os.path.join(path, "valid.npy"))
+
+
+def persist_stage(
+    stage, result, path, first, column_id, convert_1, convert_2, checkpoint_path=None,
+    on_stage=None
+):
+    """Saves a stage as soon as it finishes and records it as completed
+    (see mark_stage), so a killed run can be resumed from the last stage
+    boundary
+
+    While poly_no_inter has a checkpoint (it stopped at its time budget)
+    the stages are saved but not recorded, so a resumed run goes on from
+    the checkpoint
+
+    Parameters
+    ----------
+    stage : str
+        Stage of STAGES that finished
+    result : dict
+        Output of run_pipeline so far
+    path : str
+        Directory of the store
+    first : str
+        First stage of the run, the projected points are saved with it
+    column_id : str
+        column from the DataFrame that contains node locations
+    checkpoint_path : str, optional
+        Directory of the checkpoints of poly_no_inter
+    on_stage : function, optional
+        See run_pipeline, called after saving
+
+    Returns
+    -------
+
+    
+    """
+    if stage == first:
+        write_points(path, result["df"], column_id, convert_1, convert_2)
+    save_stage(path, stage, result)
+    if checkpoint_path is None or not has_checkpoint(checkpoint_path):
+        mark_stage(path, stage)
+    if on_stage is not None:
+        on_stage(stage, result)
+
+
+def load_state(path):
+    """Loads the outputs saved with save_stage
+
+    Parameters
+    ----------
+    path : str
+        Directory of the store
+
+    Returns
+    -------
+    dict
+        Dictionary with the polygons and trees of the saved stages, the
+        crs and the validity of the nodes (valid) if it was saved
+
+    """
+    meta = read_meta(path)
+    state = {"crs": meta["crs"]}
+    for key in STATE_KEYS:
+        if key.endswith("_loc_hull") and meta.get(key) is not None:
+            state[key] = read_hulls(path, key)
+        elif key.endswith("_loc_tree") and meta.get(key) is not None:
+            state[key] = read_trees(path, key)
+    if os.path.exists(os.path.join(path, "valid.npy")):
+        state["valid"] = read_array(path, "valid", mmap_mode=None)
+    return state
+
+
+def partition_crs(main_df, crs_by_partition, key, default, actual_1, actual_2):
+    """Returns the projected CRS of a partition
+
+    Parameters
+    ----------
+    main_df : pandas.core.frame.DataFrame
+        DataFrame of the partition with geographic coordinates
+    crs_by_partition : dict, str or None
+        Dictionary with partitions as keys and CRSs as values, "utm" for
+        the UTM zone of the centroid of every partition or None to use
+        the default
+    key :
+        Value of the partition
+    default : str
+        CRS used when the partition has no specific CRS
+
+    Returns
+    -------
+    str
+
+    """
+    if crs_by_partition == "utm":
+        latitude, longitude = main_df[[actual_1, actual_2]].mean().values
+        return utm_epsg(latitude, longitude)
+    if crs_by_partition is None:
+        return default
+    return crs_by_partition.get(key, default)
+
+
+def run_partition(
+    item, crs_by_partition=None, stages=STAGES, cache_dir=None, resume=False, on_stage=None,
+    **params
+):
+    """Runs the pipeline over one partition
+
+    Parameters
+    ----------
+    item : tuple
+        (key, DataFrame) of the partition
+    crs_by_partition : dict, str or None
+        See partition_crs
+    stages : list of str
+        See run_pipeline
+    cache_dir : str, optional
+        Directory where the outputs of every partition are saved as soon
+        as every stage finishes (see persist_stage), and loaded from
+        before the run when the stages do not start at init. The stages
+        after the first one that runs are dropped from it before the
+        run. poly_no_inter also saves its checkpoints there unless
+        inter_options has a checkpoint_path
+    resume : bool
+        If True, the stages already saved in cache_dir are not run again.
+        poly_no_inter goes on from its last checkpoint whenever init does
+        not run again and its output is saved in cache_dir
+    on_stage : function, optional
+        See run_pipeline
+    params :
+        See run_pipeline
+
+    Returns
+    -------
+    dict
+        Output of run_pipeline with the partition key
+
+    """
+    key, sub_df = item
+    params = {**DEFAULT_PARAMS, **params}
+    params["convert_epsg"] = partition_crs(
+        sub_df, crs_by_partition, key, params["convert_epsg"],
+        params["actual_1"], params["actual_2"]
+    )
+    state = None
+    path = None
+    if cache_dir is not None:
+        path = os.path.join(cache_dir, "pipeline" if key is None else str(key))
+        done = completed_stages(path)
+        if resume:
+            stages = [stage for stage in stages if stage not in done]
+        if done and "init" not in stages:
+            state = load_state(path)
+            # The saved polygons are only valid in the CRS they were made
+            params["convert_epsg"] = state["crs"]
+        # A checkpoint is only valid for the saved output of init
+        params["inter_options"] = {
+            "checkpoint_path": os.path.join(path, "inter_checkpoint"),
+            "resume": "init" not in stages and "init" in done,
+            **params["inter_options"],
+        }
+        checkpoint_path = params["inter_options"]["checkpoint_path"]
+        if "init" in stages and checkpoint_path is not None:
+            remove_checkpoint(checkpoint_path)
+        os.makedirs(path, exist_ok=True)
+        first = first_stage(stages)
+        clear_stages(path, first)
+        # The directory name is a string, the key keeps its type
+        update_meta(path, crs=params["convert_epsg"], partition=encode_keys([key])[0])
+        on_stage = partial(
+            persist_stage,
+            path=path,
+            first=STAGES[first] if first < len(STAGES) else None,
+            column_id=params["column_id"],
+            convert_1=params["convert_1"],
+            convert_2=params["convert_2"],
+            checkpoint_path=checkpoint_path,
+            on_stage=on_stage,
+        )
+    result = run_pipeline(sub_df, stages, state, on_stage, **params)
+    result["partition"] = key
+    return result
+
+
+def submit_stage_tasks(stage, result, pool, pending, stage_tasks, max_pending=2):
+    """Submits the tasks of a finished stage to a pool of workers
+
+    Parameters
+    ----------
+    stage : str
+        Stage of STAGES that finished
+    result : dict
+        Output of run_pipeline so far. The tasks receive a shallow copy,
+        so later stages do not change what they see
+    pool : concurrent.futures.Executor
+        Pool of workers
+    pending : set of concurrent.futures.Future
+        Unfinished tasks, see submit_bounded
+    stage_tasks : dict
+        Dictionary with stages as keys and lists of functions of the
+        result as values
+    max_pending : int
+        See submit_bounded
+
+    Returns
+    -------
+
+
+    """
+    snapshot = dict(result)
+    for task in stage_tasks.get(stage, []):
+        submit_bounded(pool, pending, task, snapshot, max_pending=max_pending)
+
+
+def run_partition_background(
+    item, stage_tasks, executor="process", max_workers=1, max_pending=2, **kwargs
+):
+    """Runs run_partition while the outputs of the finished stages are
+    rendered or exported in a pool of workers
+
+    The tasks of a stage are submitted as soon as the stage finishes and
+    run while the next stages compute, at most max_pending of them wait
+    at the same time and all of them are joined before returning, so the
+    wall time is close to the largest of computing and writing instead
+    of their sum
+
+    Parameters
+    ----------
+    item : tuple
+        (key, DataFrame) of the partition, key is None for a single plane
+    stage_tasks : dict
+        Dictionary with stages of STAGES as keys and lists of functions
+        of the result as values (picklable with the process executor,
+        e.g. a functools.partial of a module function)
+    executor : str
+        See EXECUTORS
+    max_workers : int
+        Number of workers of the pool
+    max_pending : int
+        See submit_bounded
+    kwargs :
+        Keyword arguments of run_partition
+
+    Returns
+    -------
+    dict
+        See run_partition
+
+    """
+    if executor not in EXECUTORS:
+        raise ValueError(f"executor must be one of {list(EXECUTORS)}")
+    pending = set()
+    with EXECUTORS[executor](max_workers=max_workers) as pool:
+        result = run_partition(
+            item,
+            on_stage=partial(
+                submit_stage_tasks,
+                pool=pool,
+                pending=pending,
+                stage_tasks=stage_tasks,
+                max_pending=max_pending,
+            ),
+            **kwargs,
+        )
+        wait_all(pending)
+    return result
+
+
+def merge_results(results):
+    """Merges the outputs of run_partition
+
+    Polygons and trees are keyed by (partition, location) and every
+    partition keeps its own projected CRS, given in the crs dictionary
+
+    Parameters
+    ----------
+    results : list of dict
+        Outputs of run_partition
+
+    Returns
+    -------
+    dict
+        Dictionary with the same keys as run_pipeline
+
+    """
+    merged = {}
+    # Only the outputs of the stages that were run or loaded
+    names = set.intersection(*[set(result) for result in results])
+    for name in [
+        "init_loc_hull", "init_loc_tree", "inter_loc_hull", "inter_loc_tree",
+        "smooth_loc_hull", "compact_loc_hull"
+    ]:
+        if name in names:
+            merged[name] = {
+                (result["partition"], loc): value
+                for result in results
+                for loc, value in result[name].items()
+            }
+    for name in ["df", "df_good", "df_bad"]:
+        if name in names:
+            merged[name] = pd.concat([result[name] for result in results])
+    for name in ["valid", "full_valid"]:
+        if name in names:
+            merged[name] = np.concatenate([result[name] for result in results])
+    merged["crs"] = {result["partition"]: result["crs"] for result in results}
+    if "df_good" in names:
+        merged["percentage"] = round(
+            100 * merged["df_good"].shape[0] / merged["df"].shape[0], 2
+        )
+    return merged
+
+
+def split_partitions(main_df, partition_column):
+    """Returns the partitions of a DataFrame
+
+    Rows without a value in partition_column raise a ValueError, since
+    groupby would drop them from the outputs
+
+    Parameters
+    ----------
+    main_df : pandas.core.frame.DataFrame
+        DataFrame with geographic coordinates
+    partition_column : str
+        Column used to split the DataFrame
+
+    Returns
+    -------
+    list of tuple
+        (key, DataFrame) of every partition in order of appearance
+
+    """
+    missing = main_df[partition_column].isna()
+    if missing.any():
+        raise ValueError(
+            f"{missing.sum()} rows have no value in {partition_column}, "
+            f"e.g. {list(main_df.index[missing][:5])}"
+        )
+    partitions = list(main_df.groupby(partition_column, sort=False))
+    return partitions
+
+
+def run_partitioned(
+    main_df, partition_column="ciudad", crs_by_partition=None, executor="process",
+    max_workers=None, stages=STAGES, cache_dir=None, resume=False, **params
+):
+    """Runs the pipeline independently over every partition of a DataFrame
+
+    Every partition (e.g. every city) gets its own intersections,
+    Voronoi diagram and optionally its own projected CRS, and partitions
+    are processed in a pool of workers
+
+    Parameters
+    ----------
+    main_df : pandas.core.frame.DataFrame
+        DataFrame with geographic coordinates
+    partition_column : str
+        Column used to split the DataFrame
+    crs_by_partition : dict, str or None
+        See partition_crs
+    executor : str or None
+        See parallel_map
+    max_workers : int, optional
+        See parallel_map
+    stages : list of str
+        See run_pipeline
+    cache_dir : str, optional
+        See run_partition
+    resume : bool
+        See run_partition
+    params :
+        See run_pipeline
+
+    Returns
+    -------
+    dict
+        See merge_results
+
+    """
+    partitions = split_partitions(main_df, partition_column)
+    results = parallel_map(
+        partial(
+            run_partition,
+            crs_by_partition=crs_by_partition,
+            stages=stages,
+            cache_dir=cache_dir,
+            resume=resume,
+            **params,
+        ),
+        partitions,
+        executor,
+        max_workers,
+    )
+    merged = merge_results(results)
+    return merged
@@ -69,3 +69,24 @@ def coordinates_projection(main_df, actual_epsg, convert_epsg, actual_1, actual_
         transformer, copy_df[actual_1].values, copy_df[actual_2].values
     )
     return copy_df
+
+
+def utm_epsg(latitude, longitude):
+    """Returns the EPSG code of the WGS 84 UTM zone of a location
+
+    Parameters
+    ----------
+    latitude : float
+        Latitude in degrees
+    longitude : float
+        Longitude in degrees
+
+    Returns
+    -------
+    str
+        EPSG code as 'epsg:326XX' (north) or 'epsg:327XX' (south)
+
+    """
+    zone = int((longitude + 180) // 6) % 60 + 1
+    hemisphere = 326 if latitude >= 0 else 327
+    return f"epsg:{hemisphere}{zone:02d}"
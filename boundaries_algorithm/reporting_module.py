@@ -0,0 +1,218 @@
+"""
+A module for summarizing the validation of nodes per location
+from a boolean validity mask
+"""
+import numpy as np
+import pandas as pd
+
+from boundaries_algorithm.validation.poly_module import polygon_vertices
+
+
+def group_codes(main_df, columns):
+    """Returns an integer code per node for the combinations of columns
+
+    Parameters
+    ----------
+    main_df : pandas.core.frame.DataFrame
+        DataFrame with the columns
+    columns : list of str
+        Columns that define the groups (e.g. city and location)
+
+    Returns
+    -------
+    tuple
+        (codes, index) where codes is an array aligned with the rows of
+        main_df and index has the values of the columns of every code
+
+    """
+    column_codes = []
+    levels = []
+    for column in columns:
+        codes, uniques = pd.factorize(main_df[column], sort=True)
+        # Missing values get the last code, as with use_na_sentinel=False of pandas 1.5
+        if (codes < 0).any():
+            codes = np.where(codes < 0, len(uniques), codes)
+            uniques = uniques.insert(len(uniques), np.nan)
+        column_codes.append(codes)
+        levels.append(uniques)
+    if len(columns) == 1:
+        return column_codes[0], pd.Index(levels[0], name=columns[0])
+    # Only the combinations present in main_df get a code, in sorted order
+    combinations, codes = np.unique(
+        np.column_stack(column_codes), axis=0, return_inverse=True
+    )
+    index = pd.MultiIndex.from_arrays(
+        [level[combinations[:, i]] for i, level in enumerate(levels)], names=columns
+    )
+    return codes, index
+
+
+def validity_counts(valid, codes, n_groups):
+    """Returns the number of nodes and of good nodes of every group
+
+    Parameters
+    ----------
+    valid : numpy.ndarray
+        Boolean array, True for good nodes
+    codes : numpy.ndarray
+        Group of every node, see group_codes
+    n_groups : int
+        Number of groups
+
+    Returns
+    -------
+    tuple
+        (total, good) integer arrays of size n_groups
+
+    """
+    total = np.bincount(codes, minlength=n_groups)
+    good = np.bincount(codes[np.asarray(valid, dtype=bool)], minlength=n_groups)
+    return total, good
+
+
+def resumen_from_counts(total, good):
+    """Returns the summary of validation from counts per location
+
+    Parameters
+    ----------
+    total : pandas.core.series.Series
+        Number of nodes per location
+    good : pandas.core.series.Series
+        Number of good nodes per location
+
+    Returns
+    -------
+    pandas.core.frame.DataFrame
+        DataFrame with NO, SI and Validación [%] columns
+
+    """
+    good = good.reindex(total.index, fill_value=0)
+    resumen = pd.DataFrame({"NO": total - good, "SI": good}).astype(int)
+    resumen["Validación [%]"] = 100 * round(resumen["SI"] / total, 4)
+    return resumen.sort_index()
+
+
+def polygon_areas(main_loc_hull, names):
+    """Returns the area of every polygon in km2
+
+    Parameters
+    ----------
+    main_loc_hull : dict with values as shapely.geometry.polygon.Polygon
+        Polygons keyed by location, or by tuples such as
+        (partition, location)
+    names : list of str
+        Names of the parts of the keys
+
+    Returns
+    -------
+    pandas.core.series.Series
+        Areas in squared CRS units divided by 1e6, km2 for CRSs in meters
+
+    """
+    areas = pd.Series(
+        {key: 0.0 if hull is None else hull.area / 1e6 for key, hull in main_loc_hull.items()},
+        dtype=float,
+    )
+    areas.index.names = names
+    return areas
+
+
+def validation_report(main_df, valid, columns, main_loc_hull=None, hull_columns=None):
+    """Returns the number of good and bad nodes, the percentage of good
+    nodes and optionally the polygon area of every group
+
+    Counts are aggregated with numpy.bincount over integer codes of the
+    groups, so no row of main_df is copied
+
+    Parameters
+    ----------
+    main_df : pandas.core.frame.DataFrame
+        DataFrame with the columns
+    valid : numpy.ndarray
+        Boolean array aligned with the rows of main_df, see ident_good_mask
+    columns : list of str
+        Columns that define the groups, e.g. [column_id] per location or
+        [partition_column] per city
+    main_loc_hull : dict with values as shapely.geometry.polygon.Polygon, optional
+        Polygons whose area is added to the report. When the groups are
+        coarser than the polygons the areas are summed
+    hull_columns : list of str, optional
+        Names of the parts of the keys of main_loc_hull, columns if None
+
+    Returns
+    -------
+    pandas.core.frame.DataFrame
+        DataFrame with NO, SI, Validación [%] and Área [km2] columns
+
+    """
+    codes, index = group_codes(main_df, columns)
+    total, good = validity_counts(valid, codes, len(index))
+    resumen = resumen_from_counts(pd.Series(total, index=index), pd.Series(good, index=index))
+    if main_loc_hull is not None:
+        hull_columns = columns if hull_columns is None else hull_columns
+        areas = polygon_areas(main_loc_hull, hull_columns)
+        if len(columns) < len(hull_columns):
+            areas = areas.groupby(level=columns).sum()
+        resumen["Área [km2]"] = areas.reindex(resumen.index, fill_value=0.0).round(2)
+    return resumen
+
+
+def compaction_report(
+    main_df, valid, full_valid, columns, main_loc_hull, compact_loc_hull, hull_columns=None
+):
+    """Returns the vertices and areas of the full and compacted polygons
+    and the number of nodes whose validation changes with the compaction
+    per group, see compact_polygons
+
+    Parameters
+    ----------
+    main_df : pandas.core.frame.DataFrame
+        DataFrame with the columns
+    valid : numpy.ndarray
+        Boolean array aligned with the rows of main_df, validity with the
+        compacted polygons
+    full_valid : numpy.ndarray
+        Boolean array aligned with the rows of main_df, validity with the
+        full polygons
+    columns : list of str
+        Columns that define the groups, see validation_report
+    main_loc_hull : dict with values as shapely.geometry.polygon.Polygon
+        Full polygons
+    compact_loc_hull : dict with values as shapely.geometry.polygon.Polygon
+        Compacted polygons
+    hull_columns : list of str, optional
+        Names of the parts of the keys of the polygons, columns if None
+
+    Returns
+    -------
+    pandas.core.frame.DataFrame
+        DataFrame with Vértices, Vértices compactos, Área [km2],
+        Área compacta [km2], Cambio de área [%] and Cambios de
+        validación columns
+
+    """
+    codes, index = group_codes(main_df, columns)
+    changed = np.asarray(valid, dtype=bool) != np.asarray(full_valid, dtype=bool)
+    _, changes = validity_counts(changed, codes, len(index))
+    hull_columns = columns if hull_columns is None else hull_columns
+    polygons = {}
+    for name, loc_hull in [("", main_loc_hull), (" compactos", compact_loc_hull)]:
+        vertices = pd.Series(
+            {key: polygon_vertices(hull) for key, hull in loc_hull.items()}, dtype=int
+        )
+        vertices.index.names = hull_columns
+        polygons["Vértices" + name] = vertices
+    polygons["Área [km2]"] = polygon_areas(main_loc_hull, hull_columns)
+    polygons["Área compacta [km2]"] = polygon_areas(compact_loc_hull, hull_columns)
+    report = pd.DataFrame(polygons)
+    if len(columns) < len(hull_columns):
+        report = report.groupby(level=columns).sum()
+    report = report.reindex(index, fill_value=0)
+    report["Cambio de área [%]"] = (
+        100 * (report["Área compacta [km2]"] / report["Área [km2]"] - 1)
+    ).round(2)
+    report[["Área [km2]", "Área compacta [km2]"]] = report[
+        ["Área [km2]", "Área compacta [km2]"]
+    ].round(2)
+    report["Cambios de validación"] = changes
+    return report.sort_index()
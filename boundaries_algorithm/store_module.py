@@ -0,0 +1,602 @@
+"""
+A module for storing the intermediate results of the pipeline as
+columnar memory-mapped NumPy arrays
+
+A store is a directory with one .npy file per array, one .wkb buffer
+per dictionary of polygons and a meta.json file with the keys of the
+dictionaries and the completed stages
+"""
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+import shapely.wkb
+
+from boundaries_algorithm.validation.nx_module import (
+    tree_to_arrays,
+    arrays_to_tree,
+)
+from boundaries_algorithm.validation.poly_module import add_onion_layers
+
+
+def read_meta(path):
+    """Returns the metadata of a store
+
+    Parameters
+    ----------
+    path : str
+        Directory of the store
+
+    Returns
+    -------
+    dict
+
+    """
+    meta_path = os.path.join(path, "meta.json")
+    if not os.path.exists(meta_path):
+        return {"stages": []}
+    with open(meta_path) as file:
+        meta = json.load(file)
+    return meta
+
+
+def update_meta(path, **values):
+    """Updates the metadata of a store
+
+    Parameters
+    ----------
+    path : str
+        Directory of the store
+    values :
+        Keys and values to save
+
+    Returns
+    -------
+
+
+    """
+    meta = read_meta(path)
+    meta.update(values)
+    with open(os.path.join(path, "meta.json"), "w") as file:
+        json.dump(meta, file)
+
+
+def write_array(path, name, array):
+    """Saves an array of the store
+
+    Parameters
+    ----------
+    path : str
+        Directory of the store
+    name : str
+        Name of the array
+    array : numpy.ndarray
+
+    Returns
+    -------
+
+
+    """
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, name + ".npy"), np.asarray(array), allow_pickle=False)
+
+
+def read_array(path, name, mmap_mode="r"):
+    """Returns an array of the store, memory-mapped by default
+
+    Parameters
+    ----------
+    path : str
+        Directory of the store
+    name : str
+        Name of the array
+    mmap_mode : str or None
+        See numpy.load
+
+    Returns
+    -------
+    numpy.ndarray
+
+    """
+    array = np.load(os.path.join(path, name + ".npy"), mmap_mode=mmap_mode, allow_pickle=False)
+    return array
+
+
+def encode_keys(keys):
+    """Returns dictionary keys that can be saved in json
+
+    Parameters
+    ----------
+    keys : iterable
+        Keys of a dictionary, tuples are saved as lists and NumPy
+        scalars as Python scalars
+
+    Returns
+    -------
+    list
+
+    """
+    return [
+        list(key) if isinstance(key, tuple) else key.item() if isinstance(key, np.generic) else key
+        for key in keys
+    ]
+
+
+def decode_keys(keys):
+    """Returns the dictionary keys saved with encode_keys
+
+    Parameters
+    ----------
+    keys : list
+        Keys saved with encode_keys
+
+    Returns
+    -------
+    list
+
+    """
+    return [tuple(key) if isinstance(key, list) else key for key in keys]
+
+
+def write_ids(path, name, ids):
+    """Saves an array of node ids keeping their type
+
+    Numeric and string ids are saved as they are, other ids (e.g. mixed
+    types) are saved as codes of their values, kept in meta.json
+
+    Parameters
+    ----------
+    path : str
+        Directory of the store
+    name : str
+        Name of the array
+    ids : array-like
+
+    Returns
+    -------
+
+
+    """
+    ids = np.asarray(ids)
+    if ids.dtype == object and all(isinstance(value, str) for value in ids):
+        ids = ids.astype(str)
+    if ids.dtype == object:
+        codes, values = pd.factorize(ids)
+        write_array(path, name, codes)
+        update_meta(path, **{f"{name}_values": encode_keys(values.tolist())})
+    else:
+        write_array(path, name, ids)
+        update_meta(path, **{f"{name}_values": None})
+
+
+def concatenate_ids(parts):
+    """Returns the concatenation of arrays of node ids
+
+    Arrays of different types are joined as objects so that numpy does not
+    cast the ids to strings or floats
+
+    Parameters
+    ----------
+    parts : list
+        list of numpy.ndarray, empty arrays are skipped
+
+    Returns
+    -------
+    numpy.ndarray
+
+    """
+    parts = [part for part in parts if part.size > 0]
+    if not parts:
+        return np.zeros(0)
+    if len({part.dtype for part in parts}) > 1:
+        parts = [part.astype(object) for part in parts]
+    return np.concatenate(parts)
+
+
+def read_ids(path, name, mmap_mode="r"):
+    """Returns the array of node ids saved with write_ids
+
+    Parameters
+    ----------
+    path : str
+        Directory of the store
+    name : str
+        Name of the array
+    mmap_mode : str or None
+        See numpy.load, ids saved as codes are not memory-mapped
+
+    Returns
+    -------
+    numpy.ndarray
+
+    """
+    values = read_meta(path).get(f"{name}_values")
+    if values is None:
+        return read_array(path, name, mmap_mode)
+    ids = np.empty(len(values), dtype=object)
+    ids[:] = decode_keys(values)
+    return ids[read_array(path, name, None)]
+
+
+def write_points(path, main_df, column_id, convert_1, convert_2):
+    """Saves the ids, projected coordinates and location codes of nodes
+
+    Parameters
+    ----------
+    path : str
+        Directory of the store
+    main_df : pandas.core.frame.DataFrame
+        DataFrame with nodes as index and projected coordinates
+    column_id : str
+        column from the DataFrame that contains node locations
+
+    Returns
+    -------
+
+
+    """
+    codes, locs = pd.factorize(main_df[column_id])
+    write_ids(path, "ids", main_df.index.values)
+    write_array(path, "x", main_df[convert_1].values.astype(float))
+    write_array(path, "y", main_df[convert_2].values.astype(float))
+    write_array(path, "zone_codes", codes.astype(np.int32))
+    update_meta(
+        path,
+        zones=encode_keys(locs.tolist()),
+        columns=[column_id, convert_1, convert_2],
+    )
+
+
+def read_points(path, mmap_mode="r"):
+    """Returns the arrays saved with write_points
+
+    Parameters
+    ----------
+    path : str
+        Directory of the store
+    mmap_mode : str or None
+        See numpy.load
+
+    Returns
+    -------
+    dict
+        Dictionary with ids, x, y and zone_codes arrays and the list of
+        zones that the codes refer to
+
+    """
+    points = {name: read_array(path, name, mmap_mode) for name in ["x", "y", "zone_codes"]}
+    points["ids"] = read_ids(path, "ids", mmap_mode)
+    points["zones"] = decode_keys(read_meta(path)["zones"])
+    return points
+
+
+def points_df(path):
+    """Returns the DataFrame saved with write_points
+
+    Parameters
+    ----------
+    path : str
+        Directory of the store
+
+    Returns
+    -------
+    pandas.core.frame.DataFrame
+
+    """
+    points = read_points(path)
+    column_id, convert_1, convert_2 = read_meta(path)["columns"]
+    zones = np.array(points["zones"], dtype=object)
+    main_df = pd.DataFrame(
+        {
+            column_id: zones[points["zone_codes"]],
+            convert_1: points["x"],
+            convert_2: points["y"],
+        },
+        index=points["ids"],
+    )
+    return main_df
+
+
+def write_hulls(path, name, loc_hull):
+    """Saves a dictionary of polygons as a WKB buffer with offsets
+
+    Parameters
+    ----------
+    path : str
+        Directory of the store
+    name : str
+        Name of the dictionary
+    loc_hull : dict with values as shapely.geometry.polygon.Polygon
+        Polygons to save (None values are allowed)
+
+    Returns
+    -------
+
+
+    """
+    blobs = [b"" if hull is None else shapely.wkb.dumps(hull) for hull in loc_hull.values()]
+    offsets = np.cumsum([0] + [len(blob) for blob in blobs])
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, name + ".wkb"), "wb") as file:
+        file.write(b"".join(blobs))
+    write_array(path, name + "_offsets", offsets)
+    update_meta(path, **{name: encode_keys(loc_hull.keys())})
+
+
+def read_hulls(path, name):
+    """Returns the dictionary of polygons saved with write_hulls
+
+    Parameters
+    ----------
+    path : str
+        Directory of the store
+    name : str
+        Name of the dictionary
+
+    Returns
+    -------
+    dict with values as shapely.geometry.polygon.Polygon
+
+    """
+    keys = decode_keys(read_meta(path)[name])
+    offsets = read_array(path, name + "_offsets")
+    wkb_path = os.path.join(path, name + ".wkb")
+    buffer = (
+        np.memmap(wkb_path, dtype=np.uint8, mode="r")
+        if os.path.getsize(wkb_path) > 0
+        else np.zeros(0, dtype=np.uint8)
+    )
+    loc_hull = {
+        key: shapely.wkb.loads(bytes(buffer[start:end])) if end > start else None
+        for key, start, end in zip(keys, offsets[:-1], offsets[1:])
+    }
+    return loc_hull
+
+
+def write_trees(path, name, loc_tree):
+    """Saves a dictionary of trees as concatenated arrays with offsets
+
+    Parameters
+    ----------
+    path : str
+        Directory of the store
+    name : str
+        Name of the dictionary
+    loc_tree : dict with values as networkx.classes.graph.Graph
+        Trees to save
+
+    Returns
+    -------
+
+
+    """
+    arrays = [tree_to_arrays(T) for T in loc_tree.values()]
+    for i, array_name in enumerate(["nodes", "xy", "counts", "arcs", "weights"]):
+        parts = [array[i] for array in arrays]
+        if array_name == "nodes":
+            write_ids(path, f"{name}_nodes", concatenate_ids(parts))
+        else:
+            write_array(path, f"{name}_{array_name}", np.concatenate(parts) if parts else np.zeros(0))
+    write_array(path, f"{name}_node_offsets", np.cumsum([0] + [a[0].size for a in arrays]))
+    write_array(path, f"{name}_arc_offsets", np.cumsum([0] + [a[3].shape[0] for a in arrays]))
+    layers = {
+        len(T.graph["layer_sizes"]) - 1
+        for T in loc_tree.values()
+        if "layer_sizes" in T.graph
+    }
+    # Ids of the nodes dropped by the outlier pre-filter of mst_init
+    has_outliers = any("outliers" in T.graph for T in loc_tree.values())
+    if has_outliers:
+        outliers = [np.asarray(T.graph.get("outliers", [])) for T in loc_tree.values()]
+        write_ids(path, f"{name}_outliers", concatenate_ids(outliers))
+        write_array(path, f"{name}_outlier_offsets", np.cumsum([0] + [o.size for o in outliers]))
+    # Stop criteria of mst_pruning, see insert_node_tree
+    pruning = [
+        [int(T.graph["initial_size"]), float(T.graph["threshold_N"])]
+        if "initial_size" in T.graph else None
+        for T in loc_tree.values()
+    ]
+    update_meta(
+        path,
+        **{
+            name: encode_keys(loc_tree.keys()),
+            f"{name}_layers": max(layers, default=None),
+            f"{name}_outliers": has_outliers,
+            f"{name}_pruning": pruning,
+        },
+    )
+
+
+def read_trees(path, name):
+    """Returns the dictionary of trees saved with write_trees
+
+    Onion layers (see add_onion_layers) are computed again, the outliers
+    and the stop criteria of mst_pruning graph attributes are kept and the
+    members of collapsed nodes are not saved
+
+    Parameters
+    ----------
+    path : str
+        Directory of the store
+    name : str
+        Name of the dictionary
+
+    Returns
+    -------
+    dict with values as networkx.classes.graph.Graph
+
+    """
+    meta = read_meta(path)
+    keys = decode_keys(meta[name])
+    arrays = {
+        array_name: read_array(path, f"{name}_{array_name}")
+        for array_name in ["xy", "counts", "arcs", "weights", "node_offsets", "arc_offsets"]
+    }
+    arrays["nodes"] = read_ids(path, f"{name}_nodes")
+    node_offsets = arrays["node_offsets"]
+    arc_offsets = arrays["arc_offsets"]
+    if meta.get(f"{name}_outliers"):
+        outliers = read_ids(path, f"{name}_outliers", None)
+        outlier_offsets = read_array(path, f"{name}_outlier_offsets")
+    loc_tree = {}
+    for i, key in enumerate(keys):
+        nodes = slice(node_offsets[i], node_offsets[i + 1])
+        arcs = slice(arc_offsets[i], arc_offsets[i + 1])
+        T = arrays_to_tree(
+            arrays["nodes"][nodes],
+            arrays["xy"][nodes],
+            arrays["counts"][nodes],
+            arrays["arcs"][arcs],
+            arrays["weights"][arcs],
+        )
+        if meta.get(f"{name}_outliers"):
+            T.graph["outliers"] = outliers[outlier_offsets[i]:outlier_offsets[i + 1]]
+        pruning = meta.get(f"{name}_pruning", [None] * len(keys))[i]
+        if pruning is not None:
+            T.graph["initial_size"], T.graph["threshold_N"] = pruning
+        if meta.get(f"{name}_layers") is not None:
+            T = add_onion_layers(T, meta[f"{name}_layers"])
+        loc_tree[key] = T
+    return loc_tree
+
+
+def mark_stage(path, stage):
+    """Records that a stage finished and its outputs are in the store
+
+    Parameters
+    ----------
+    path : str
+        Directory of the store
+    stage : str
+        Name of the stage
+
+    Returns
+    -------
+
+
+    """
+    stages = completed_stages(path)
+    if stage not in stages:
+        update_meta(path, stages=stages + [stage])
+
+
+def completed_stages(path):
+    """Returns the stages recorded with mark_stage
+
+    Parameters
+    ----------
+    path : str
+        Directory of the store
+
+    Returns
+    -------
+    list of str
+
+    """
+    return read_meta(path)["stages"]
+
+
+def save_checkpoint(path, loc_hull, loc_tree, iteration, poly_inter):
+    """Saves the state of poly_no_inter
+
+    The state is written in a temporary directory that replaces the
+    previous checkpoint, so a job killed while saving keeps the last
+    complete checkpoint
+
+    Parameters
+    ----------
+    path : str
+        Directory of the checkpoint
+    loc_hull : dict with values as shapely.geometry.polygon.Polygon
+        Current polygons
+    loc_tree : dict with values as networkx.classes.graph.Graph
+        Current trees
+    iteration : int
+        Number of pruning iterations done
+    poly_inter : list of set
+        Sets of intersecting polygons, see identify_poly_inter
+
+    Returns
+    -------
+
+
+    """
+    tmp_path = path.rstrip(os.sep) + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    write_hulls(tmp_path, "hull", loc_hull)
+    write_trees(tmp_path, "tree", loc_tree)
+    update_meta(
+        tmp_path,
+        iteration=int(iteration),
+        poly_inter=[encode_keys(my_set) for my_set in poly_inter if len(my_set) > 1],
+    )
+    old_path = path.rstrip(os.sep) + ".old"
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.exists(path):
+        os.rename(path, old_path)
+    os.rename(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+def has_checkpoint(path):
+    """Returns True if a directory has a checkpoint of poly_no_inter
+
+    Parameters
+    ----------
+    path : str
+        Directory of the checkpoint
+
+    Returns
+    -------
+    bool
+
+    """
+    return any(
+        os.path.exists(os.path.join(checkpoint_path, "meta.json"))
+        for checkpoint_path in [path, path.rstrip(os.sep) + ".old"]
+    )
+
+
+def remove_checkpoint(path):
+    """Removes a checkpoint of poly_no_inter and its temporary copies
+
+    Parameters
+    ----------
+    path : str
+        Directory of the checkpoint
+
+    Returns
+    -------
+
+
+    """
+    for suffix in ["", ".old", ".tmp"]:
+        shutil.rmtree(path.rstrip(os.sep) + suffix, ignore_errors=True)
+
+
+def load_checkpoint(path):
+    """Returns the state of poly_no_inter saved with save_checkpoint
+
+    Parameters
+    ----------
+    path : str
+        Directory of the checkpoint
+
+    Returns
+    -------
+    tuple or None
+        Polygons, trees, number of iterations and the sets of
+        intersecting polygons with more than one element, None if there
+        is no checkpoint
+
+    """
+    if not os.path.exists(path):
+        path = path.rstrip(os.sep) + ".old"
+    if not os.path.exists(os.path.join(path, "meta.json")):
+        return None
+    meta = read_meta(path)
+    loc_hull = read_hulls(path, "hull")
+    loc_tree = read_trees(path, "tree")
+    poly_inter = [set(decode_keys(my_set)) for my_set in meta["poly_inter"]]
+    return loc_hull, loc_tree, meta["iteration"], poly_inter
@@ -0,0 +1,170 @@
+"""
+A module for validating point files that do not fit in memory
+against saved polygons
+"""
+import os
+import numpy as np
+import pandas as pd
+
+from boundaries_algorithm.preprocessing_module import (
+    crs_transformer,
+    crs_transformation,
+)
+from boundaries_algorithm.reporting_module import resumen_from_counts
+from boundaries_algorithm.validation.validation import ident_good_mask
+
+
+def read_chunks(path, chunksize, columns=None):
+    """Yields DataFrames of at most chunksize rows of a CSV or Parquet file
+
+    Parameters
+    ----------
+    path : str
+        Path of the file, Parquet if it ends with .parquet
+    chunksize : int
+        Number of rows per chunk
+    columns : list of str, optional
+        Columns to read
+
+    Returns
+    -------
+    generator of pandas.core.frame.DataFrame
+
+    """
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        parquet_file = pq.ParquetFile(path)
+        for batch in parquet_file.iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunksize, usecols=columns)
+
+
+def append_chunk(main_df, path, writer=None):
+    """Appends a DataFrame to a CSV or Parquet file
+
+    Parameters
+    ----------
+    main_df : pandas.core.frame.DataFrame
+        Rows to append
+    path : str
+        Path of the file, Parquet if it ends with .parquet
+    writer : pyarrow.parquet.ParquetWriter, optional
+        Writer returned by the previous call for Parquet files
+
+    Returns
+    -------
+    pyarrow.parquet.ParquetWriter or None
+        Writer to pass to the next call (None for CSV files)
+
+    """
+    if path.endswith(".parquet"):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = pa.Table.from_pandas(main_df, preserve_index=False)
+        if writer is None:
+            writer = pq.ParquetWriter(path, table.schema)
+        writer.write_table(table)
+        return writer
+    main_df.to_csv(path, mode="a", header=not os.path.exists(path), index=False)
+    return None
+
+
+def stream_validation(
+    input_path, output_path, main_loc_hull, crs, column_id, actual_epsg, actual_1,
+    actual_2, convert_1="X", convert_2="Y", id_column=None, partition_column=None,
+    chunksize=1_000_000
+):
+    """Validates the points of a file chunk by chunk
+
+    Every chunk is projected, classified against the polygons as in
+    ident_good_proj and appended to output_path with the columns id,
+    column_id (and partition_column) and Validado, so memory depends
+    on chunksize and not on the size of the file
+
+    Parameters
+    ----------
+    input_path : str
+        CSV or Parquet file with the points
+    output_path : str
+        CSV or Parquet file that is created with the results
+    main_loc_hull : dict with values as shapely.geometry.polygon.Polygon
+        Polygons keyed by location, or by (partition, location) if
+        partition_column is given
+    crs : str or dict
+        Projected CRS of the polygons, or dictionary with the CRS of
+        every partition if partition_column is given
+    id_column : str, optional
+        Column with the id of the points, the row number if None
+    partition_column : str, optional
+        Column that splits the points as in run_partitioned. A ValueError
+        is raised for partitions without polygons instead of writing
+        their points as NO
+
+    Returns
+    -------
+    pandas.core.frame.DataFrame
+        Summary of validation per location, see resumen_from_counts
+
+    """
+    if os.path.exists(output_path):
+        os.remove(output_path)
+    if partition_column is None:
+        hulls = {None: main_loc_hull}
+        crs = {None: crs}
+    else:
+        hulls = {}
+        for (partition, loc), hull in main_loc_hull.items():
+            hulls.setdefault(partition, {})[loc] = hull
+    transformers = {
+        partition: crs_transformer(actual_epsg, partition_crs)
+        for partition, partition_crs in crs.items()
+    }
+    keys = [column_id] if partition_column is None else [partition_column, column_id]
+    columns = keys + [actual_1, actual_2] + ([] if id_column is None else [id_column])
+    counts = None
+    writer = None
+    offset = 0
+    for chunk in read_chunks(input_path, chunksize, columns):
+        mask = np.zeros(chunk.shape[0], dtype=bool)
+        if partition_column is None:
+            groups = {None: np.arange(chunk.shape[0])}
+        else:
+            groups = chunk.groupby(partition_column, sort=False, dropna=False).indices
+            missing = [partition for partition in groups if partition not in hulls]
+            if missing:
+                # e.g. keys of another type than the keys of the polygons
+                raise ValueError(
+                    f"partitions {missing} of {partition_column} have no polygons, "
+                    f"the polygons have partitions {list(hulls)}"
+                )
+        for partition, idx in groups.items():
+            sub_df = chunk.iloc[idx][[column_id]].copy()
+            sub_df[convert_1], sub_df[convert_2] = crs_transformation(
+                transformers[partition],
+                chunk[actual_1].values[idx],
+                chunk[actual_2].values[idx],
+            )
+            mask[idx] = ident_good_mask(
+                sub_df, hulls[partition], column_id, convert_1, convert_2
+            )
+        ids = (
+            np.arange(offset, offset + chunk.shape[0])
+            if id_column is None
+            else chunk[id_column].values
+        )
+        offset += chunk.shape[0]
+        out = pd.DataFrame({"id": ids})
+        for key in keys:
+            out[key] = chunk[key].values
+        out["Validado"] = np.where(mask, "SI", "NO")
+        writer = append_chunk(out, output_path, writer)
+        # Running counts per location
+        chunk_counts = out[keys].assign(total=1, good=mask).groupby(keys).sum()
+        counts = chunk_counts if counts is None else counts.add(chunk_counts, fill_value=0)
+    if writer is not None:
+        writer.close()
+    resumen = resumen_from_counts(counts["total"], counts["good"])
+    return resumen
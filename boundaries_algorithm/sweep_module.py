@@ -0,0 +1,194 @@
+"""
+A module for evaluating grids of parameters of the pipeline
+reusing the minimum spanning trees and their pruning
+"""
+import itertools
+from functools import partial
+import numpy as np
+import pandas as pd
+
+from boundaries_algorithm.parallel_module import parallel_map
+from boundaries_algorithm.store_module import write_points, points_df
+from boundaries_algorithm.validation.validation import (
+    mst_init,
+    poly_no_inter,
+    smooth_polygons,
+    ident_good_proj,
+    tree_outliers,
+)
+from boundaries_algorithm.validation.nx_module import (
+    pruning_trajectory,
+    trajectory_tree,
+)
+from boundaries_algorithm.validation.poly_module import all_convex_hull
+
+
+def zone_validation(main_df, df_good, column_id):
+    """Returns the percentage of good nodes per location
+
+    Parameters
+    ----------
+    main_df : pandas.core.frame.DataFrame
+        DataFrame with all the nodes
+    df_good : pandas.core.frame.DataFrame
+        DataFrame with the good nodes, see ident_good_proj
+    column_id : str
+        column from the DataFrame that contains node locations
+
+    Returns
+    -------
+    pandas.core.series.Series
+        Percentage per location and the global one with key Total
+
+    """
+    total = main_df[column_id].value_counts()
+    good = df_good[column_id].value_counts().reindex(total.index, fill_value=0)
+    percentage = 100 * good / total
+    percentage["Total"] = 100 * good.sum() / total.sum()
+    return percentage.round(2)
+
+
+def evaluate_setting(
+    setting, main_df, loc_mst, loc_trajectory, column_id, convert_1, convert_2, Ns,
+    batch_size=1
+):
+    """Runs the pipeline after polygons_init for one pair of thresholds
+
+    Parameters
+    ----------
+    setting : tuple
+        (threshold_N, buffer_area)
+    main_df : pandas.core.frame.DataFrame or str
+        DataFrame with projected coordinates or directory of a store
+        with them (see store_module.write_points)
+    loc_mst : dict with values as networkx.classes.graph.Graph
+        Unpruned trees, see mst_init
+    loc_trajectory : dict
+        Pruning trajectories of the trees, see pruning_trajectory
+    Ns : list of int
+        Values of N evaluated in smooth_polygons
+    batch_size : int, float or function
+        See poly_no_inter
+
+    Returns
+    -------
+    dict
+        Dictionary with (threshold_N, buffer_area, N) as keys and the
+        output of zone_validation as values
+
+    """
+    threshold_N, buffer_area = setting
+    if isinstance(main_df, str):
+        main_df = points_df(main_df)
+    loc_tree = {
+        loc: trajectory_tree(T, loc_trajectory[loc], threshold_N, buffer_area)
+        for loc, T in loc_mst.items()
+    }
+    loc_hull = all_convex_hull(loc_tree)
+    inter_loc_hull, _ = poly_no_inter(loc_hull, loc_tree, batch_size)
+    results = {}
+    for N in Ns:
+        smooth_loc_hull = smooth_polygons(inter_loc_hull, N)
+        df_good, _, _ = ident_good_proj(
+            main_df, smooth_loc_hull, column_id, convert_1, convert_2,
+            tree_outliers(loc_mst)
+        )
+        results[(threshold_N, buffer_area, N)] = zone_validation(
+            main_df, df_good, column_id
+        )
+    return results
+
+
+def parameter_sweep(
+    main_df, column_id, convert_1, convert_2, threshold_N, buffer_area, N,
+    epsilon=None, hull_layers=None, batch_size=1, executor="process",
+    max_workers=None, store_dir=None, outlier_k=None, outlier_factor=10.0,
+    max_nodes=None
+):
+    """Evaluates the validation percentage of a grid of parameters
+
+    The MST of every location and its pruning trajectory are computed
+    once, then every combination of threshold_N and buffer_area gets
+    its trees from the trajectories (as mst_pruning would return them)
+    and runs poly_no_inter, smooth_polygons and ident_good_proj in a
+    pool of workers
+
+    Parameters
+    ----------
+    main_df : pandas.core.frame.DataFrame
+        DataFrame with projected coordinates
+    column_id : str
+        column from the DataFrame that contains node locations
+    threshold_N : float or list of float
+        Values of threshold_N
+    buffer_area : float or list of float
+        Values of buffer_area
+    N : int or list of int
+        Values of N of smooth_polygons
+    epsilon : float, optional
+        See mst_init
+    hull_layers : int, optional
+        See mst_init
+    batch_size : int, float or function
+        See poly_no_inter
+    executor : str or None
+        See parallel_map
+    max_workers : int, optional
+        See parallel_map
+    store_dir : str, optional
+        If given, the nodes are saved there as memory-mapped arrays and
+        workers read them from disk instead of receiving a copy of main_df
+    outlier_k : int, optional
+        See mst_init
+    outlier_factor : float
+        See mst_init
+    max_nodes : int, optional
+        See mst_init
+
+    Returns
+    -------
+    pandas.core.frame.DataFrame
+        DataFrame with locations (and Total) as index and
+        (threshold_N, buffer_area, N) as columns
+
+    """
+    threshold_Ns = [float(value) for value in np.atleast_1d(threshold_N)]
+    buffer_areas = [float(value) for value in np.atleast_1d(buffer_area)]
+    Ns = [int(value) for value in np.atleast_1d(N)]
+    loc_mst = mst_init(
+        main_df, column_id, convert_1, convert_2, epsilon, hull_layers, outlier_k,
+        outlier_factor, max_nodes
+    )
+    trajectories = parallel_map(
+        partial(
+            pruning_trajectory,
+            min_threshold_N=min(threshold_Ns),
+            buffer_areas=buffer_areas,
+        ),
+        loc_mst.values(),
+        executor,
+        max_workers,
+    )
+    loc_trajectory = dict(zip(loc_mst.keys(), trajectories))
+    settings = list(itertools.product(threshold_Ns, buffer_areas))
+    if store_dir is not None:
+        write_points(store_dir, main_df, column_id, convert_1, convert_2)
+    results = parallel_map(
+        partial(
+            evaluate_setting,
+            main_df=main_df if store_dir is None else store_dir,
+            loc_mst=loc_mst,
+            loc_trajectory=loc_trajectory,
+            column_id=column_id,
+            convert_1=convert_1,
+            convert_2=convert_2,
+            Ns=Ns,
+            batch_size=batch_size,
+        ),
+        settings,
+        executor,
+        max_workers,
+    )
+    sweep = pd.DataFrame({key: value for result in results for key, value in result.items()})
+    sweep.columns.names = ["threshold_N", "buffer_area", "N"]
+    return sweep
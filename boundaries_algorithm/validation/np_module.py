@@ -2,6 +2,7 @@
 A module for processing numpy arrays
 """
 import numpy as np
+from scipy.spatial import cKDTree
 
 def calculate_distances(x, y, function):
     """Calculates distances between all points according to function
@@ -25,20 +26,17 @@ def calculate_distances(x, y, function):
     
     """
     x_y = np.column_stack((x, y))
-    dist_matrix = np.triu(function(x_y))
-    dist_matrix[np.tril_indices(dist_matrix.shape[0], 0)] = np.nan
-    # Transforming the matrix of size (x.size, y.size) into a array
-    # with only the relevant information of all possible combinations
-    distances = dist_matrix[(~np.isnan(dist_matrix))]
+    # Upper triangle without the diagonal, row by row
+    distances = function(x_y)[np.triu_indices(x_y.shape[0], 1)]
     return distances
 
 
 def all_weight_arcs(nodes, X, Y, function):
     """Returns all the weighted arcs needed for a complete graph
     
-    The function uses triangular matrix properties to
-    make the process more efficient when matching arcs
-    with corresponding weights (e.i. distances)
+    The function uses the indices of the upper triangular matrix to
+    match arcs with their weights (e.i. distances) without building
+    other matrices of size n x n, see block_weight_arcs to bound the memory
 
     Parameters
     ----------
@@ -57,22 +55,56 @@ def all_weight_arcs(nodes, X, Y, function):
 
     
     """
-    size = nodes.size
-    # Creates a meshgrid a reshape it to obtain
-    # all possible permutations between nodes
-    all_arcs = np.array(np.meshgrid(nodes, nodes)).T.reshape(-1, 2)
-    # Mask the permutations to get only the possible combinations
-    ones = np.ones((size, size))
-    triu_ones = np.triu(ones, 1)
-    mask = np.array(triu_ones.flatten(), dtype=bool)
-    all_arcs = all_arcs[mask]
-    i, j = np.hsplit(all_arcs, 2)
+    # Pairs of the upper triangle in the same order as calculate_distances
+    i, j = np.triu_indices(nodes.size, 1)
     weights = calculate_distances(X, Y, function)
     # Create the tuples of (u, v, w)
-    nec_arcs = np.vstack((i.reshape(-1), j.reshape(-1), weights))
+    nec_arcs = np.vstack((nodes[i], nodes[j], weights))
     return nec_arcs.T
 
 
+def block_weight_arcs(X, Y, function, max_memory=2**28, dtype=np.float64):
+    """Yields the weighted arcs of a complete graph in blocks of rows of
+    the upper triangular matrix
+
+    Every block computes function between a group of nodes and the
+    nodes after them, so the memory used is bounded by max_memory
+    instead of growing with n x n
+
+    Parameters
+    ----------
+    X : numpy.ndarray
+        array contaning node X coordinates
+    Y : numpy.ndarray
+        array contaning node Y coordinates
+    function : function
+        function from sklearn.metrics.pairwaise package
+        to calculate distances between two arrays (e.g.
+        euclidean_distances or haversine_distances)
+    max_memory : int
+        Approximate number of bytes used per block
+    dtype : numpy.dtype
+        Type of the weights, numpy.float32 halves their memory
+
+    Returns
+    -------
+    generator of tuple
+        (i, j, w) arrays with the positions of the nodes of every arc
+        (i < j) and its weight, in the same order as all_weight_arcs
+
+    """
+    x_y = np.column_stack((X, Y))
+    size = x_y.shape[0]
+    # Distances, triangle indices and output per pair of the block
+    pair_bytes = 8 + 2 * 8 + 2 * 8 + np.dtype(dtype).itemsize
+    rows = max(1, int(max_memory // (pair_bytes * max(size, 1))))
+    for start in range(0, size - 1, rows):
+        stop = min(start + rows, size - 1)
+        block = function(x_y[start:stop], x_y[start:])
+        i, j = np.triu_indices(stop - start, 1, size - start)
+        yield i + start, j + start, block[i, j].astype(dtype)
+
+
 def node_attributes_generation(nodes, X, Y):
     """Returns cooridnates as node_atributes
 
@@ -92,3 +124,160 @@ def node_attributes_generation(nodes, X, Y):
     """
     node_attributes = {node: (X[i], Y[i]) for i, node in enumerate(nodes)}
     return node_attributes
+
+
+def collapse_coordinates(nodes, X, Y, epsilon=0.0):
+    """Collapses coincident nodes into weighted representative nodes
+
+    Nodes with identical coordinates (or falling in the same square cell
+    of side epsilon) are represented by the first of them, so duplicated
+    geocodes do not add zero weight arcs to the complete graph
+
+    Parameters
+    ----------
+    nodes : numpy.ndarray
+        array containing node numbers
+    X : numpy.ndarray
+        array contaning node X coordinates
+    Y : numpy.ndarray
+        array contaning node Y coordinates
+    epsilon : float
+        Side of the cells used to consider two nodes as coincident.
+        If 0 only identical coordinates are collapsed
+
+    Returns
+    -------
+    tuple
+        (nodes, X, Y, counts, members) of the representative nodes, where
+        counts is the number of collapsed nodes and members is a dictionary
+        with representative nodes as keys and arrays of original nodes as
+        values
+
+    """
+    if epsilon > 0:
+        keys = np.column_stack((np.floor(X / epsilon), np.floor(Y / epsilon)))
+    else:
+        keys = np.column_stack((X, Y))
+    _, first, inverse, counts = np.unique(
+        keys, axis=0, return_index=True, return_inverse=True, return_counts=True
+    )
+    inverse = inverse.reshape(-1)
+    # Split the original nodes by group keeping the input order
+    order = np.argsort(inverse, kind="stable")
+    groups = np.split(nodes[order], np.cumsum(counts)[:-1])
+    # Keep the representatives in the order of their first appearance
+    rank = np.argsort(first, kind="stable")
+    rep = first[rank]
+    members = {nodes[first[k]]: groups[k] for k in rank}
+    return nodes[rep], X[rep], Y[rep], counts[rank], members
+
+
+def occupied_cells(X, Y, cell):
+    """Returns the number of square cells of side cell with nodes
+
+    Parameters
+    ----------
+    X : numpy.ndarray
+        array contaning node X coordinates
+    Y : numpy.ndarray
+        array contaning node Y coordinates
+    cell : float
+        Side of the cells, distinct coordinates are counted if 0
+
+    Returns
+    -------
+    int
+
+    """
+    if cell > 0:
+        keys = np.floor(X / cell) + 1j * np.floor(Y / cell)
+    else:
+        keys = X + 1j * Y
+    return np.unique(keys).size
+
+
+def coreset_cell_size(X, Y, max_nodes, epsilon=0.0, growth=np.sqrt(2), steps=8):
+    """Returns a cell side for which the nodes occupy at most max_nodes
+    cells, see collapse_coordinates
+
+    The side is bracketed in a geometric sequence of ratio growth that
+    starts at the side of a grid of max_nodes cells over the nodes and
+    then refined by bisection, so the number of cells is close to the
+    budget
+
+    Parameters
+    ----------
+    X : numpy.ndarray
+        array contaning node X coordinates
+    Y : numpy.ndarray
+        array contaning node Y coordinates
+    max_nodes : int
+        Maximum number of collapsed nodes
+    epsilon : float
+        Minimum side, returned if it already meets the budget
+    growth : float
+        Ratio between consecutive sides
+    steps : int
+        Number of bisection steps
+
+    Returns
+    -------
+    float
+
+    """
+    if occupied_cells(X, Y, epsilon) <= max_nodes:
+        return epsilon
+    extent = max(np.ptp(X), np.ptp(Y))
+    cell = max(epsilon, extent / np.sqrt(max_nodes))
+    while cell / growth > epsilon and occupied_cells(X, Y, cell / growth) <= max_nodes:
+        cell /= growth
+    while occupied_cells(X, Y, cell) > max_nodes:
+        cell *= growth
+    low = max(cell / growth, epsilon)
+    for _ in range(steps):
+        middle = (low + cell) / 2
+        if occupied_cells(X, Y, middle) <= max_nodes:
+            cell = middle
+        else:
+            low = middle
+    return cell
+
+
+def knn_outliers(X, Y, k=8, factor=10.0):
+    """Returns a boolean mask of the nodes far away from their neighbours
+
+    A node is an outlier when the distance to its k-th nearest neighbour
+    is more than factor times the median of the non zero distances to
+    the k-th neighbour, so duplicated coordinates (which have zero
+    distance to their copies) do not turn the filter off. Distances are
+    queried in a KD-tree, so the cost is O(n log n)
+
+    Parameters
+    ----------
+    X : numpy.ndarray
+        array contaning node X coordinates
+    Y : numpy.ndarray
+        array contaning node Y coordinates
+    k : int
+        Number of neighbours
+    factor : float
+        Number of times the median distance that a node can be away
+        from its k-th neighbour
+
+    Returns
+    -------
+    numpy.ndarray
+        Boolean array, True for outliers. No node is an outlier when there
+        are k + 1 nodes or less
+
+    """
+    xy = np.column_stack((X, Y)).astype(float)
+    if xy.shape[0] <= k + 1:
+        return np.zeros(xy.shape[0], dtype=bool)
+    # The first neighbour of every node is the node itself
+    distances, _ = cKDTree(xy).query(xy, k=k + 1)
+    kth = distances[:, -1]
+    if not (kth > 0).any():
+        return np.zeros(xy.shape[0], dtype=bool)
+    threshold = factor * np.median(kth[kth > 0])
+    return kth > threshold
@@ -1,12 +1,18 @@
 """
 A module for processing networkx graphs
 """
+import numpy as np
 import pandas as pd
 import networkx as nx
+import shapely
 from networkx.algorithms.tree import minimum_spanning_tree
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import minimum_spanning_tree as sparse_minimum_spanning_tree
 from boundaries_algorithm.validation.poly_module import (
     convex_hull,
     get_buffer_area,
+    approx_buffer_area,
+    refresh_onion_layers,
 )
 
 
@@ -32,11 +38,58 @@ def mst(arcs, node_attributes):
     """
     G = nx.Graph()
     G.add_weighted_edges_from(arcs)
+    # Isolated nodes (e.g. a location with collapsed coordinates)
+    G.add_nodes_from(node_attributes)
     T = minimum_spanning_tree(G, weight="weight")
     nx.set_node_attributes(T, node_attributes, name="xy")
     return T
 
 
+def streaming_mst(nodes, arc_blocks, node_attributes):
+    """Returns the MST of arcs given in blocks keeping in memory only
+    the current forest and one block
+
+    The MST of the union of two sets of arcs is the MST of the MST of
+    the first one and the second one, so every block is merged with the
+    minimum spanning forest of the previous blocks
+
+    Parameters
+    ----------
+    nodes : numpy.ndarray
+        array containing node numbers
+    arc_blocks : iterable of tuple
+        (i, j, w) arrays with the positions of the nodes of the arcs and
+        their weights, see block_weight_arcs
+    node_attributes : dict
+        dictionary with nodes as keys and attributes as values
+
+    Returns
+    -------
+
+    
+    """
+    size = nodes.size
+    forest_i = np.zeros(0, dtype=np.int64)
+    forest_j = np.zeros(0, dtype=np.int64)
+    forest_w = np.zeros(0)
+    for i, j, w in arc_blocks:
+        # Sparse matrices drop zero weights, coincident nodes get the
+        # smallest positive weight so the order of the arcs is the same
+        tiny = np.finfo(w.dtype).tiny
+        w = np.where(w > 0, w, tiny)
+        graph = coo_matrix(
+            (np.concatenate((forest_w.astype(w.dtype), w)),
+             (np.concatenate((forest_i, i)), np.concatenate((forest_j, j)))),
+            shape=(size, size),
+        )
+        forest = sparse_minimum_spanning_tree(graph.tocsr()).tocoo()
+        forest_i, forest_j, forest_w = forest.row, forest.col, forest.data
+    forest_w = np.where(forest_w > np.finfo(forest_w.dtype).tiny, forest_w, 0.0)
+    arcs = np.column_stack((nodes[forest_i], nodes[forest_j], forest_w.astype(float)))
+    T = mst(arcs, node_attributes)
+    return T
+
+
 def all_rmc_mean(main_G):
     """Computes the mean of all shortest path in a graph for
     node
@@ -60,10 +113,76 @@ def all_rmc_mean(main_G):
     copy_G = main_G.copy()
     rmc = dict(nx.all_pairs_dijkstra_path_length(copy_G, weight="weight"))
     rmc = pd.DataFrame.from_dict(rmc, orient="index")
-    rmc_mean = rmc.mean()
+    counts = pd.Series(dict(copy_G.nodes(data="count", default=1)))
+    if (counts == 1).all():
+        rmc_mean = rmc.mean()
+    else:
+        # Collapsed nodes count as many times as nodes they represent
+        counts = counts.reindex(rmc.index)
+        rmc_mean = rmc.mul(counts, axis=0).sum() / counts.sum()
     return rmc_mean
 
 
+def tree_rmc_mean(main_T):
+    """Computes the mean shortest path of every node of a tree
+
+    Same values as all_rmc_mean for trees, but the sums of distances
+    are obtained in O(n) with one pass from the leaves to a root and
+    another one back to the leaves
+
+    Parameters
+    ----------
+    main_T : networkx.classes.graph.Graph
+        A connected networkx Graph object of type tree whose nodes
+        may have a count attribute
+
+    Returns
+    -------
+    pandas.core.series.Series
+
+    """
+    root = next(iter(main_T.nodes))
+    edges = list(nx.bfs_edges(main_T, root))
+    order = [root] + [v for _, v in edges]
+    position = {node: i for i, node in enumerate(order)}
+    parent = np.array([-1] + [position[u] for u, _ in edges])
+    weight = np.array([0.0] + [main_T[u][v]["weight"] for u, v in edges])
+    counts = np.array([main_T.nodes[node].get("count", 1) for node in order], dtype=float)
+    total = counts.sum()
+    # Size of the subtree of every node and sum of distances to its nodes
+    sub_counts = counts.copy()
+    sub_sums = np.zeros(len(order))
+    for i in range(len(order) - 1, 0, -1):
+        sub_counts[parent[i]] += sub_counts[i]
+        sub_sums[parent[i]] += sub_sums[i] + weight[i] * sub_counts[i]
+    # Moving from the parent to a node gets closer to its subtree only
+    sums = np.zeros(len(order))
+    sums[0] = sub_sums[0]
+    for i in range(1, len(order)):
+        sums[i] = sums[parent[i]] + weight[i] * (total - 2 * sub_counts[i])
+    rmc_mean = pd.Series(sums / total, index=order)
+    return rmc_mean
+
+
+def tree_size(main_T):
+    """Returns the number of original nodes represented by a tree
+
+    Parameters
+    ----------
+    main_T : networkx.classes.graph.Graph
+        A networkx Graph object of type tree whose nodes
+        may have a count attribute
+
+    Returns
+    -------
+    int
+        Sum of the count attribute of nodes (1 if missing)
+
+    """
+    size = sum(count for _, count in main_T.nodes(data="count", default=1))
+    return size
+
+
 def prune_node_tree(main_T, u):
     """Prune a node from a tree graph
     
@@ -91,7 +210,131 @@ def prune_node_tree(main_T, u):
     return copy_T
 
 
-def mst_pruning(main_T, threshold_N, buffer_area):
+def prune_nodes_tree(main_T, nodes):
+    """Prune several nodes from a tree graph at once
+
+    Same as prune_node_tree but removing all the nodes
+    before getting the biggest subgraph
+
+    Parameters
+    ----------
+    main_T : networkx.classes.graph.Graph
+        A networkx Graph object of type tree
+        with nodes and weighted arcs
+    nodes : list
+        Nodes that are desired to be pruned
+
+    Returns
+    -------
+
+    
+    """
+    copy_T = main_T.copy()
+    copy_T.remove_nodes_from(nodes)
+    # Get the biggest subgraph of the connected_components
+    copy_T = copy_T.subgraph(max(nx.connected_components(copy_T), key=len))
+    return copy_T
+
+
+def batch_size_schedule(batch_size, iteration, n):
+    """Returns the number of nodes to prune in an iteration
+
+    Parameters
+    ----------
+    batch_size : int, float or function
+        If int, a constant number of nodes. If float between 0 and 1,
+        the fraction of the current number of nodes. If function, it is
+        called as batch_size(iteration, n) and must return an int
+    iteration : int
+        Number of the current pruning iteration
+    n : int
+        Current number of nodes in the tree
+
+    Returns
+    -------
+    int
+        Number of nodes to prune, at least 1
+
+    """
+    if callable(batch_size):
+        k = batch_size(iteration, n)
+    elif isinstance(batch_size, float) and batch_size < 1:
+        k = batch_size * n
+    else:
+        k = batch_size
+    return max(1, int(k))
+
+
+def select_prune_nodes(main_T, rmc_mean, k, max_count=None, leaf_quantile=None):
+    """Returns the nodes to prune in a batch iteration
+
+    Without leaf_quantile the nodes are the first k that the single step
+    pruning would choose: the node with maximum mean shortest path is
+    pruned and the mean shortest paths are updated with tree_rmc_mean
+    before choosing the next one, so chains of outliers are followed.
+    With leaf_quantile all the leaves beyond the quantile of the mean
+    shortest paths are returned at once
+
+    Parameters
+    ----------
+    main_T : networkx.classes.graph.Graph
+        A networkx Graph object of type tree
+        with nodes and weighted arcs
+    rmc_mean : pandas.core.series.Series
+        Mean shortest path length of the nodes, see all_rmc_mean
+    k : int
+        Maximum number of nodes to prune
+    max_count : float, optional
+        Maximum number of original nodes to prune (see tree_size). The
+        node that crosses this value is still pruned, as in mst_pruning
+    leaf_quantile : float, optional
+        Quantile of rmc_mean beyond which all leaves are pruned
+
+    Returns
+    -------
+    list
+        Nodes to prune
+
+    """
+    if leaf_quantile is None:
+        copy_T = main_T
+        size = tree_size(copy_T)
+        nodes = []
+        # Never prune the whole tree
+        for _ in range(max(min(k, main_T.number_of_nodes() - 1), 1)):
+            node = rmc_mean.idxmax()
+            nodes.append(node)
+            if len(nodes) == k or copy_T.number_of_nodes() <= 2:
+                break
+            copy_T = prune_node_tree(copy_T, node)
+            if max_count is not None and size - tree_size(copy_T) >= max_count:
+                break
+            # Same order as all_rmc_mean, so ties are broken as in the
+            # single step pruning
+            order = list(
+                nx.single_source_dijkstra_path_length(copy_T, next(iter(copy_T)), weight="weight")
+            )
+            rmc_mean = tree_rmc_mean(copy_T).reindex(order)
+        return nodes
+    leaves = [node for node, degree in main_T.degree if degree == 1]
+    candidates = rmc_mean[leaves].sort_values(ascending=False, kind="stable")
+    candidates = candidates[candidates >= rmc_mean.quantile(leaf_quantile)]
+    if max_count is not None:
+        counts = np.array([main_T.nodes[node].get("count", 1) for node in candidates.index])
+        last = np.searchsorted(np.cumsum(counts), max_count, side="left")
+        candidates = candidates.iloc[: last + 1]
+    # Never prune the whole tree
+    nodes = list(candidates.index)[: main_T.number_of_nodes() - 1]
+    # Always prune at least the farthest node
+    if not nodes:
+        nodes = [rmc_mean.idxmax()]
+    return nodes
+
+
+def mst_pruning(
+    main_T, threshold_N, buffer_area, batch_size=1, leaf_quantile=None,
+    buffer_method=None, buffer_resolution=8
+):
     """Prunes MST according to threesholds
     
     Function that prunes a tree graoh until one of the conditions of
@@ -104,7 +347,33 @@ def mst_pruning(main_T, threshold_N, buffer_area):
         with nodes and weighted arcs
     threshold_N : float
         Percentage of N taht represents the minimum number of nodes
-        that can have a tree
+        that can have a tree. Collapsed nodes count as many times as
+        nodes they represent
+    batch_size : int, float or function
+        Number of nodes pruned per iteration, see batch_size_schedule.
+        The nodes of a batch are the ones the single step pruning would
+        prune, in the same order (see select_prune_nodes), and threshold_N
+        is checked after every node. The area criterion is only evaluated
+        every k nodes, so the result is the single step tree with the next
+        steps of its pruning removed: up to k - 1 steps while the
+        criterion stays false, more if it is true again at the end of a
+        batch. Every step also drops the subtrees it disconnects.
+        With differential_run on data.csv, batch_size=3 gives the same
+        polygons and classification as single step pruning, and
+        batch_size=10 prunes 12 more nodes of Sur (init relative
+        symmetric difference 0.25, Hausdorff 2.8 km) with the same
+        polygons after poly_no_inter and no classification changes
+    leaf_quantile : float, optional
+        If given, every iteration prunes all leaves whose mean shortest
+        path is beyond this quantile instead of batch_size leaves
+    buffer_method : str, optional
+        If None the buffer area is computed exactly with get_buffer_area,
+        otherwise it is estimated with approx_buffer_area using the
+        "grid" or "montecarlo" method, updated incrementally as nodes
+        are pruned
+    buffer_resolution : int
+        Cells per buffer radius of the estimator, a higher value is more
+        accurate and slower
 
     Returns
     -------
@@ -112,22 +381,383 @@ def mst_pruning(main_T, threshold_N, buffer_area):
     
     """
     copy_T = main_T.copy()
-    N = copy_T.number_of_nodes()
+    N = tree_size(copy_T)
+    # Stop criteria of the pruning, see insert_node_tree
+    copy_T.graph["initial_size"] = N
+    copy_T.graph["threshold_N"] = threshold_N
+    n = N
     rmc_mean = all_rmc_mean(copy_T)
     hull_area = convex_hull(copy_T).area
-    buffer_area = get_buffer_area(copy_T, buffer_area * rmc_mean.mean())
+    estimator = None
+    if buffer_method is None:
+        buffer_area = get_buffer_area(copy_T, buffer_area * rmc_mean.mean())
+    else:
+        buffer_area, estimator = approx_buffer_area(
+            copy_T, buffer_area * rmc_mean.mean(), estimator, buffer_method,
+            buffer_resolution
+        )
     flag = True
+    iteration = 0
     while hull_area >= buffer_area and flag:
 
-        # Get the node with maximum mean shortest paths
-        # which emulates getting the fardest node
-        u = rmc_mean.idxmax()
-        copy_T = prune_node_tree(copy_T, u)
-        n = copy_T.number_of_nodes()
+        # Get the nodes with maximum mean shortest paths
+        # which emulates getting the fardest nodes
+        k = batch_size_schedule(batch_size, iteration, copy_T.number_of_nodes())
+        nodes = select_prune_nodes(
+            copy_T, rmc_mean, k, n - threshold_N * N, leaf_quantile
+        )
+        # One at a time, as the single step pruning keeps the biggest
+        # subgraph after every node
+        for node in nodes:
+            copy_T = prune_node_tree(copy_T, node)
+        copy_T = refresh_onion_layers(copy_T)
+        n = tree_size(copy_T)
         rmc_mean = all_rmc_mean(copy_T)
         hull_area = convex_hull(copy_T).area
-        buffer_area = get_buffer_area(copy_T, 0.12 * rmc_mean.mean())
+        if buffer_method is None:
+            buffer_area = get_buffer_area(copy_T, 0.12 * rmc_mean.mean())
+        else:
+            buffer_area, estimator = approx_buffer_area(
+                copy_T, 0.12 * rmc_mean.mean(), estimator, buffer_method,
+                buffer_resolution
+            )
+        iteration += 1
 
         if n <= threshold_N * N:
             flag = False
     return copy_T
+
+
+def pruning_trajectory(main_T, min_threshold_N, buffer_areas):
+    """Records the single step pruning of a MST for several thresholds
+
+    The node pruned in every iteration of mst_pruning does not depend on
+    the thresholds, only the iteration where it stops does. This function
+    prunes the tree once until the smallest threshold_N (or the buffer
+    criterion) is reached, recording what is needed to know where
+    mst_pruning would have stopped for any threshold_N not smaller than
+    min_threshold_N and any of the buffer_areas
+
+    Parameters
+    ----------
+    main_T : networkx.classes.graph.Graph
+        A networkx Graph object of type tree
+        with nodes and weighted arcs
+    min_threshold_N : float
+        Smallest threshold_N that will be evaluated
+    buffer_areas : list of float
+        Values of buffer_area that will be evaluated
+
+    Returns
+    -------
+    dict
+        Dictionary with the initial size N, the initial buffer areas per
+        buffer_area value and a list of steps with the pruned nodes, size,
+        convex hull area and buffer area after every iteration
+
+    """
+    copy_T = main_T.copy()
+    N = tree_size(copy_T)
+    n = N
+    rmc_mean = all_rmc_mean(copy_T)
+    hull_area = convex_hull(copy_T).area
+    init_buffer = {
+        value: get_buffer_area(copy_T, value * rmc_mean.mean()) for value in buffer_areas
+    }
+    trajectory = {
+        "N": N,
+        "hull_area": hull_area,
+        "init_buffer": init_buffer,
+        "steps": [],
+    }
+    # Stop when no setting would keep pruning
+    flag = any(hull_area >= value for value in init_buffer.values())
+    while flag:
+        nodes = select_prune_nodes(copy_T, rmc_mean, 1)
+        pruned_T = refresh_onion_layers(prune_nodes_tree(copy_T, nodes))
+        removed = set(copy_T.nodes).difference(pruned_T.nodes)
+        copy_T = pruned_T
+        n = tree_size(copy_T)
+        rmc_mean = all_rmc_mean(copy_T)
+        hull_area = convex_hull(copy_T).area
+        buffer_area = get_buffer_area(copy_T, 0.12 * rmc_mean.mean())
+        trajectory["steps"].append(
+            {"removed": removed, "n": n, "hull_area": hull_area, "buffer_area": buffer_area}
+        )
+        flag = hull_area >= buffer_area and n > min_threshold_N * N
+    return trajectory
+
+
+def trajectory_tree(main_T, trajectory, threshold_N, buffer_area):
+    """Returns the tree mst_pruning would return for some thresholds
+    using a trajectory recorded with pruning_trajectory
+
+    Parameters
+    ----------
+    main_T : networkx.classes.graph.Graph
+        The tree used to record the trajectory
+    trajectory : dict
+        Output of pruning_trajectory
+    threshold_N : float
+        Percentage of N that represents the minimum number of nodes
+        that can have a tree
+    buffer_area : float
+        One of the buffer_areas of the trajectory
+
+    Returns
+    -------
+
+    
+    """
+    removed = set()
+    if trajectory["hull_area"] >= trajectory["init_buffer"][buffer_area]:
+        for step in trajectory["steps"]:
+            removed |= step["removed"]
+            if step["n"] <= threshold_N * trajectory["N"]:
+                break
+            if step["hull_area"] < step["buffer_area"]:
+                break
+    copy_T = main_T.copy()
+    copy_T.remove_nodes_from(removed)
+    return refresh_onion_layers(copy_T)
+
+
+def tree_to_arrays(main_T):
+    """Returns the nodes, coordinates, counts and arcs of a tree as arrays
+
+    Parameters
+    ----------
+    main_T : networkx.classes.graph.Graph
+        A networkx Graph object of type tree
+        with nodes and weighted arcs
+
+    Returns
+    -------
+    tuple
+        (nodes, xy, counts, arcs, weights) where nodes keep the type of
+        the node ids, xy has shape (n, 2) and arcs has shape (m, 2) with
+        the positions in nodes of the ends of every arc
+
+    """
+    node_attributes = nx.get_node_attributes(main_T, "xy")
+    # Mixed ids are kept as objects instead of being cast to strings
+    nodes = pd.Index(list(main_T.nodes)).values
+    position = {node: i for i, node in enumerate(main_T.nodes)}
+    xy = np.array([node_attributes[node] for node in main_T.nodes], dtype=float).reshape(-1, 2)
+    counts = np.array([count for _, count in main_T.nodes(data="count", default=1)])
+    arcs = np.array(
+        [(position[u], position[v]) for u, v in main_T.edges], dtype=np.int64
+    ).reshape(-1, 2)
+    weights = np.array([w for _, _, w in main_T.edges(data="weight")], dtype=float)
+    return nodes, xy, counts, arcs, weights
+
+
+def arrays_to_tree(nodes, xy, counts, arcs, weights):
+    """Returns the tree saved with tree_to_arrays
+
+    Parameters
+    ----------
+    nodes : numpy.ndarray
+        array containing node numbers
+    xy : numpy.ndarray
+        array of shape (n, 2) with node coordinates
+    counts : numpy.ndarray
+        array with the number of nodes represented by every node
+    arcs : numpy.ndarray
+        array of shape (m, 2) with the positions in nodes of the ends
+        of every arc
+    weights : numpy.ndarray
+        array with the weight of every arc
+
+    Returns
+    -------
+
+    
+    """
+    T = nx.Graph()
+    node_list = nodes.tolist()
+    T.add_nodes_from(node_list)
+    T.add_weighted_edges_from(
+        (node_list[u], node_list[v], w)
+        for (u, v), w in zip(np.asarray(arcs).tolist(), np.asarray(weights).tolist())
+    )
+    nx.set_node_attributes(T, dict(zip(node_list, map(tuple, xy.tolist()))), name="xy")
+    if (np.asarray(counts) != 1).any():
+        nx.set_node_attributes(T, dict(zip(node_list, counts.tolist())), name="count")
+    return T
+
+
+def insert_node_mst(main_T, node, xy, cones=8, copy=True):
+    """Returns a copy of an euclidean MST with a new node
+
+    The arcs of the new node in the MST can only go to the nearest node
+    of every angular sector (cone) around it, so only those arcs are
+    tried: the first one attaches the node and every other one replaces
+    the longest arc of the cycle it closes, if it is longer. With 6 or
+    more cones the result is the MST of all the nodes, built in O(n)
+
+    Parameters
+    ----------
+    main_T : networkx.classes.graph.Graph
+        A networkx Graph object of type tree, see mst
+    node : object
+        New node
+    xy : tuple
+        Coordinates of the new node
+    cones : int
+        Number of angular sectors
+    copy : bool
+        If False, main_T is modified and returned instead of a copy
+
+    Returns
+    -------
+
+    
+    """
+    copy_T = main_T.copy() if copy else main_T
+    node_attributes = nx.get_node_attributes(copy_T, "xy")
+    copy_T.add_node(node, xy=tuple(xy), count=1)
+    if not node_attributes:
+        return copy_T
+    nodes = np.array(list(node_attributes.keys()), dtype=object)
+    dx, dy = (np.array(list(node_attributes.values()), dtype=float) - np.asarray(xy, dtype=float)).T
+    distances = np.hypot(dx, dy)
+    sectors = np.floor((np.arctan2(dy, dx) + np.pi) / (2 * np.pi) * cones).astype(int) % cones
+    # Nearest node of every sector
+    order = np.lexsort((distances, sectors))
+    first = order[np.r_[True, sectors[order][1:] != sectors[order][:-1]]]
+    first = first[np.argsort(distances[first], kind="stable")]
+    for i in first:
+        if copy_T.degree(node) == 0:
+            copy_T.add_edge(node, nodes[i], weight=distances[i])
+            continue
+        path = nx.shortest_path(copy_T, node, nodes[i])
+        u, v = max(zip(path[:-1], path[1:]), key=lambda arc: copy_T[arc[0]][arc[1]]["weight"])
+        if copy_T[u][v]["weight"] > distances[i]:
+            copy_T.remove_edge(u, v)
+            copy_T.add_edge(node, nodes[i], weight=distances[i])
+    return copy_T
+
+
+def insert_node_layer(main_T, node):
+    """Sets the onion layer of a node added to a tree with layers
+
+    The node gets the first layer whose hull does not contain it and
+    the size of that layer grows by one, so the hull of the layers up to
+    any intact one still contains all the nodes (see convex_hull)
+
+    Parameters
+    ----------
+    main_T : networkx.classes.graph.Graph
+        A networkx Graph object of type tree with onion
+        layers, see add_onion_layers. It is modified
+
+    Returns
+    -------
+
+
+    """
+    layer_sizes = main_T.graph["layer_sizes"].copy()
+    max_layers = layer_sizes.size - 1
+    point = shapely.geometry.Point(main_T.nodes[node]["xy"])
+    layer_xy = {}
+    for other, layer in main_T.nodes(data="layer"):
+        if other != node and layer is not None and layer < max_layers:
+            layer_xy.setdefault(layer, []).append(main_T.nodes[other]["xy"])
+    node_layer = max_layers
+    for layer in range(max_layers):
+        if layer not in layer_xy:
+            continue
+        if not shapely.geometry.MultiPoint(layer_xy[layer]).convex_hull.contains(point):
+            node_layer = layer
+            break
+    layer_sizes[node_layer] += 1
+    main_T.nodes[node]["layer"] = node_layer
+    main_T.graph["layer_sizes"] = layer_sizes
+
+
+def insert_node_tree(
+    main_T, node, xy, cones=8, buffer_method="grid", buffer_resolution=8, estimator=None,
+    copy=True
+):
+    """Inserts a node in a pruned tree unless pruning would remove it first
+
+    The node is added with insert_node_mst and the stop criteria of
+    mst_pruning are evaluated on the new tree: the hull area against the
+    buffer area (estimated with approx_buffer_area) and, for trees
+    returned by mst_pruning, the size against threshold_N of the initial
+    size plus the inserted nodes. The node is rejected only if pruning
+    would go on and the node is the one that single step pruning would
+    select (maximum mean shortest path, see tree_rmc_mean).
+    The tree is not pruned again, so when pruning would go on but select
+    another node the tree keeps nodes that mst_pruning would remove,
+    possibly including the new one in a later step. Rejected nodes are
+    not added to the initial size.
+    Every call is O(n) in the nodes of the tree. On a tree of 2000 nodes
+    it takes about 140 ms with the defaults (90 ms with Shapely 2), most
+    of it copying the tree and building the buffer area estimator again.
+    Reusing the estimator with copy=False, as insert_points does, it
+    takes about 60 ms (50 ms), mostly in tree_rmc_mean and convex_hull
+
+    Parameters
+    ----------
+    main_T : networkx.classes.graph.Graph
+        A networkx Graph object of type tree
+    node : object
+        New node
+    xy : tuple
+        Coordinates of the new node
+    cones : int
+        See insert_node_mst
+    buffer_method : str, optional
+        See mst_pruning
+    buffer_resolution : int
+        See mst_pruning
+    estimator : dict, optional
+        Buffer area estimator returned by a previous call for main_T,
+        see approx_buffer_area. It is built again if None
+    copy : bool
+        If False, main_T is modified and returned instead of a copy,
+        also when the node is rejected (it is removed again)
+
+    Returns
+    -------
+    tuple
+        (tree, accepted, estimator), the tree is main_T if the node is
+        not accepted
+
+    """
+    layer_sizes = main_T.graph.get("layer_sizes")
+    copy_T = insert_node_mst(main_T, node, xy, cones, copy)
+    if "members" in next(iter(main_T.nodes.values()), {}):
+        copy_T.nodes[node]["members"] = np.array([node])
+    if "layer_sizes" in copy_T.graph:
+        insert_node_layer(copy_T, node)
+    if "initial_size" in copy_T.graph:
+        copy_T.graph["initial_size"] += 1
+    if copy_T.number_of_nodes() <= 2:
+        return copy_T, True, estimator
+    rmc_mean = tree_rmc_mean(copy_T)
+    new_estimator = None
+    if buffer_method is None:
+        buffer_area = get_buffer_area(copy_T, 0.12 * rmc_mean.mean())
+    else:
+        buffer_area, new_estimator = approx_buffer_area(
+            copy_T, 0.12 * rmc_mean.mean(), estimator, buffer_method, buffer_resolution
+        )
+    pruning = convex_hull(copy_T).area >= buffer_area
+    if "initial_size" in copy_T.graph:
+        pruning = pruning and (
+            tree_size(copy_T) > copy_T.graph["threshold_N"] * copy_T.graph["initial_size"]
+        )
+    if pruning and rmc_mean.idxmax() == node:
+        if not copy:
+            # The node with maximum mean shortest path is a leaf, so no
+            # arc of main_T was replaced
+            main_T.remove_node(node)
+            if layer_sizes is not None:
+                main_T.graph["layer_sizes"] = layer_sizes
+            if "initial_size" in main_T.graph:
+                main_T.graph["initial_size"] -= 1
+        return main_T, False, estimator
+    return copy_T, True, new_estimator
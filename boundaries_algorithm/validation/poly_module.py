@@ -5,17 +5,25 @@ import numpy as np
 import pandas as pd
 import networkx as nx
 import shapely
+import shapely.ops
 import fiona
 import geopandas as gpd
+from scipy.spatial import cKDTree
 
 from boundaries_algorithm.validation.set_module import set_integration
 
+# Shapely 2 array functions process many geometries in one call, the
+# all_ functions fall back to one geometry at a time with Shapely 1
+SHAPELY_2 = int(shapely.__version__.split(".")[0]) >= 2
+
 
 def convex_hull(main_T):
     """Returns the convex hull as shapely polygon
     
     Funtion that uses a DataFrame and a tree graph nodes to return a
-    convex hull polygon that contains all the tree nodes
+    convex hull polygon that contains all the tree nodes. If the tree has
+    onion layers (see add_onion_layers) only the nodes up to the first
+    intact layer are used, since the rest lie inside its hull
 
     Parameters
     ----------
@@ -28,16 +36,157 @@ def convex_hull(main_T):
 
     
     """
-    copy_T = main_T.copy()
-    node_attributes = nx.get_node_attributes(copy_T, "xy")
-    # Create an array of points containing X and Y
-    # coordinates of nodes
-    pts = np.array([*node_attributes.values()])
-    pts = shapely.geometry.MultiPoint(pts)
+    pts = shapely.geometry.MultiPoint(hull_points(main_T))
     hull = pts.convex_hull
     return hull
 
 
+def hull_points(main_T):
+    """Returns the coordinates of the nodes used by convex_hull
+
+    Parameters
+    ----------
+    main_T : networkx.classes.graph.Graph
+        A networkx Graph object of type tree
+        with nodes and weighted arcs
+
+    Returns
+    -------
+    numpy.ndarray
+        Array of shape (n, 2)
+
+    """
+    # The graph is only read, so it is not copied
+    node_attributes = nx.get_node_attributes(main_T, "xy")
+    layer = intact_layer(main_T)
+    if layer is not None:
+        node_attributes = {
+            node: xy
+            for node, xy in node_attributes.items()
+            if main_T.nodes[node]["layer"] <= layer
+        }
+    # Create an array of points containing X and Y
+    # coordinates of nodes
+    pts = np.array([*node_attributes.values()], dtype=float).reshape(-1, 2)
+    return pts
+
+
+def all_convex_hull(main_loc_tree):
+    """Returns the convex hull of every tree, see convex_hull
+
+    With Shapely 2 the hulls of all trees are computed in one call
+
+    Parameters
+    ----------
+    main_loc_tree : dict with values as networkx.classes.graph.Graph
+        Dictionary with int keys as location and tree graphs as
+        values
+
+    Returns
+    -------
+    dict with values as shapely.geometry.polygon.Polygon
+
+    """
+    if not SHAPELY_2 or len(main_loc_tree) == 0:
+        return {loc: convex_hull(T) for loc, T in main_loc_tree.items()}
+    pts = [hull_points(T) for T in main_loc_tree.values()]
+    indices = np.repeat(np.arange(len(pts)), [p.shape[0] for p in pts])
+    multipoints = shapely.multipoints(np.concatenate(pts), indices=indices)
+    hulls = shapely.convex_hull(multipoints)
+    return dict(zip(main_loc_tree.keys(), hulls))
+
+
+def add_onion_layers(main_T, max_layers=8):
+    """Returns a copy of the tree with the onion layers of its nodes
+
+    The first layer are the nodes in the vertices of the convex hull, the
+    second one the vertices of the convex hull of the remaining nodes and
+    so on. Nodes deeper than max_layers get the layer max_layers. The layer
+    of every node is saved as the layer node attribute and the size of the
+    layers in the layer_sizes graph attribute, so pruned trees can tell
+    which layers are still intact
+
+    Parameters
+    ----------
+    main_T : networkx.classes.graph.Graph
+        A networkx Graph object of type tree
+        with nodes and weighted arcs
+    max_layers : int
+        Number of layers to compute
+
+    Returns
+    -------
+
+    
+    """
+    copy_T = main_T.copy()
+    node_attributes = nx.get_node_attributes(copy_T, "xy")
+    nodes = list(node_attributes.keys())
+    pts = np.array([*node_attributes.values()], dtype=float)
+    layers = np.full(len(nodes), max_layers)
+    remaining = np.arange(len(nodes))
+    for k in range(max_layers):
+        if remaining.size == 0:
+            break
+        hull = shapely.geometry.MultiPoint(pts[remaining]).convex_hull
+        if hull.geom_type != "Polygon":
+            # Collinear nodes, all of them are in the boundary
+            layers[remaining] = k
+            break
+        vertices = set(hull.exterior.coords)
+        on_hull = np.array([tuple(pt) in vertices for pt in pts[remaining]])
+        layers[remaining[on_hull]] = k
+        remaining = remaining[~on_hull]
+    nx.set_node_attributes(copy_T, dict(zip(nodes, layers.tolist())), name="layer")
+    copy_T.graph["layer_sizes"] = np.bincount(layers, minlength=max_layers + 1)
+    return copy_T
+
+
+def intact_layer(main_T):
+    """Returns the first onion layer of a tree that has all its nodes
+
+    Parameters
+    ----------
+    main_T : networkx.classes.graph.Graph
+        A networkx Graph object of type tree with onion
+        layers, see add_onion_layers
+
+    Returns
+    -------
+    int or None
+        None if the tree has no layers or all of them lost nodes
+
+    """
+    layer_sizes = main_T.graph.get("layer_sizes")
+    if layer_sizes is None:
+        return None
+    layers = [layer for _, layer in main_T.nodes(data="layer")]
+    counts = np.bincount(layers, minlength=layer_sizes.size)
+    # The last layer holds the deeper nodes, it is never a hull
+    intact = np.flatnonzero(counts[:-1] == layer_sizes[:-1])
+    layer = int(intact[0]) if intact.size > 0 else None
+    return layer
+
+
+def refresh_onion_layers(main_T):
+    """Recomputes the onion layers of a tree once all of them lost nodes
+
+    Parameters
+    ----------
+    main_T : networkx.classes.graph.Graph
+        A networkx Graph object of type tree
+
+    Returns
+    -------
+
+    
+    """
+    layer_sizes = main_T.graph.get("layer_sizes")
+    if layer_sizes is None or intact_layer(main_T) is not None:
+        return main_T
+    return add_onion_layers(main_T, layer_sizes.size - 1)
+
+
 def get_buffer_area(main_T, radius):
     """Given a MST returns the obtained buffer area with desired radius
     of the set of nodes in the graph
@@ -85,11 +234,306 @@ def make_buffer(nodes, X, Y, radius):
 
     
     """
+    if SHAPELY_2:
+        # Same resolution as GeoSeries.buffer
+        return shapely.union_all(shapely.buffer(shapely.points(X, Y), radius, quad_segs=16))
     gs = gpd.GeoSeries(gpd.points_from_xy(X, Y), index=nodes)
     buffer = gs.buffer(radius).unary_union
     return buffer
 
 
+def buffer_area_estimator(main_T, margin, resolution=8, method="grid", seed=None):
+    """Returns an estimator of the area of the union of buffers of the
+    nodes of a tree for any radius up to margin
+
+    The plane around the nodes is discretized in square cells of side
+    margin / resolution and each cell keeps the distance from one sample
+    point (its center for the grid method, a random point inside it for
+    the montecarlo method) to the nearest node. The area of the union of
+    buffers of radius r is then the area of the cells whose sample is
+    within r of a node
+
+    Parameters
+    ----------
+    main_T : networkx.classes.graph.Graph
+        A networkx Graph object of type tree
+        with nodes and weighted arcs
+    margin : float
+        Maximum radius the estimator can evaluate
+    resolution : int
+        Number of cells per margin, it controls the trade-off between
+        accuracy and speed (cost grows with the square of resolution)
+    method : str
+        "grid" or "montecarlo"
+    seed : int
+        Seed of the random generator for the montecarlo method
+
+    Returns
+    -------
+    dict
+        State of the estimator, see estimate_buffer_area and
+        update_buffer_area_estimator
+
+    """
+    node_attributes = nx.get_node_attributes(main_T, "xy")
+    nodes = list(node_attributes.keys())
+    xy = np.array([*node_attributes.values()], dtype=float)
+    side = margin / resolution
+    # Offsets of the cells that can intersect a buffer of radius margin
+    offsets = cell_offsets(resolution)
+    base = np.floor(xy / side).astype(np.int64)
+    base -= base.min(axis=0) - resolution
+    # Encode cells as integers to get the unique ones faster
+    span = base[:, 1].max() + resolution + 1
+    keys = (base[:, None, 0] + offsets[:, 0]) * span + (base[:, None, 1] + offsets[:, 1])
+    keys = np.unique(keys)
+    origin = np.floor(xy.min(axis=0) / side).astype(np.int64) - resolution
+    cells = np.column_stack((keys // span, keys % span)) + origin
+    rng = np.random.default_rng(seed) if method == "montecarlo" else None
+    samples = cell_samples(cells, side, rng)
+    dist, nearest = cKDTree(xy).query(samples)
+    # Cells out of reach can not be covered after pruning
+    reach = dist <= margin + side
+    estimator = {
+        "method": method,
+        "margin": margin,
+        "resolution": resolution,
+        "side": side,
+        "rng": rng,
+        "nodes": nodes,
+        "xy": xy,
+        "alive": np.ones(len(nodes), dtype=bool),
+        "cells": cells[reach],
+        "samples": samples[reach],
+        "dist": dist[reach],
+        "nearest": nearest[reach],
+    }
+    return estimator
+
+
+def cell_offsets(resolution):
+    """Returns the offsets of the cells that can intersect a buffer whose
+    radius is resolution cells
+
+    Parameters
+    ----------
+    resolution : int
+        See buffer_area_estimator
+
+    Returns
+    -------
+    numpy.ndarray
+        Array of shape (n, 2)
+
+    """
+    offsets = np.arange(-resolution, resolution + 1)
+    offsets = np.array(np.meshgrid(offsets, offsets)).T.reshape(-1, 2)
+    gap = (np.abs(offsets) - 1).clip(0)
+    offsets = offsets[(gap ** 2).sum(axis=1) <= resolution ** 2]
+    return offsets
+
+
+def cell_samples(cells, side, rng=None):
+    """Returns the sample point of every cell of a buffer area estimator
+
+    Parameters
+    ----------
+    cells : numpy.ndarray
+        Array of shape (n, 2) with the integer positions of the cells
+    side : float
+        Side of the cells
+    rng : numpy.random.Generator, optional
+        Random generator of the montecarlo method, the centers of the
+        cells are used if None
+
+    Returns
+    -------
+    numpy.ndarray
+        Array of shape (n, 2)
+
+    """
+    if rng is None:
+        return (cells + 0.5) * side
+    return (cells + rng.random(cells.shape)) * side
+
+
+def update_buffer_area_estimator(main_estimator, main_T):
+    """Updates a buffer area estimator after pruning or inserting nodes
+    of the tree
+
+    Only the cells whose nearest node was pruned are queried again, see
+    extend_buffer_area_estimator for the inserted nodes
+
+    Parameters
+    ----------
+    main_estimator : dict
+        State returned by buffer_area_estimator
+    main_T : networkx.classes.graph.Graph
+        Tree built from the nodes used to build the estimator by pruning
+        or inserting nodes
+
+    Returns
+    -------
+    dict
+        Updated state of the estimator
+
+    """
+    copy_estimator = main_estimator.copy()
+    known = set(copy_estimator["nodes"])
+    added = [node for node in main_T.nodes if node not in known]
+    if added:
+        copy_estimator = extend_buffer_area_estimator(
+            copy_estimator, added, [main_T.nodes[node]["xy"] for node in added]
+        )
+    alive = np.array([node in main_T for node in copy_estimator["nodes"]])
+    removed = copy_estimator["alive"] & ~alive
+    affected = removed[copy_estimator["nearest"]]
+    idx = np.flatnonzero(alive)
+    if affected.any() and idx.size > 0:
+        dist = copy_estimator["dist"].copy()
+        nearest = copy_estimator["nearest"].copy()
+        dist[affected], near = cKDTree(copy_estimator["xy"][idx]).query(
+            copy_estimator["samples"][affected]
+        )
+        nearest[affected] = idx[near]
+        copy_estimator["dist"] = dist
+        copy_estimator["nearest"] = nearest
+    copy_estimator["alive"] = alive
+    return copy_estimator
+
+
+def extend_buffer_area_estimator(main_estimator, nodes, xy):
+    """Adds new nodes to a buffer area estimator
+
+    The cells closer to a new node than to their nearest node take it as
+    nearest and the cells within reach of a new node that the estimator
+    did not have are added, so the grid method gives the same areas as
+    an estimator built with the new nodes. The cost of every node grows
+    with the number of cells
+
+    Parameters
+    ----------
+    main_estimator : dict
+        State returned by buffer_area_estimator
+    nodes : list
+        New nodes
+    xy : array-like
+        Coordinates of the new nodes
+
+    Returns
+    -------
+    dict
+        Updated state of the estimator
+
+    """
+    copy_estimator = main_estimator.copy()
+    side = copy_estimator["side"]
+    resolution = copy_estimator["resolution"]
+    offsets = cell_offsets(resolution)
+    width = 2 * resolution + 1
+    for node, point in zip(nodes, np.asarray(xy, dtype=float).reshape(-1, 2)):
+        i = len(copy_estimator["nodes"])
+        copy_estimator["nodes"] = copy_estimator["nodes"] + [node]
+        copy_estimator["xy"] = np.vstack((copy_estimator["xy"], point))
+        copy_estimator["alive"] = np.append(copy_estimator["alive"], True)
+        cells = copy_estimator["cells"]
+        samples = copy_estimator["samples"]
+        dist = copy_estimator["dist"].copy()
+        nearest = copy_estimator["nearest"].copy()
+        point_dist = np.hypot(*(samples - point).T)
+        closer = point_dist < dist
+        dist[closer] = point_dist[closer]
+        nearest[closer] = i
+        # Cells around the new node that the estimator does not have,
+        # encoded relative to the cell of the node
+        base = np.floor(point / side).astype(np.int64)
+        around = cells[(np.abs(cells - base) <= resolution).all(axis=1)] - base
+        candidates = offsets[
+            ~np.isin(
+                (offsets[:, 0] + resolution) * width + offsets[:, 1] + resolution,
+                (around[:, 0] + resolution) * width + around[:, 1] + resolution,
+            )
+        ] + base
+        new_samples = cell_samples(candidates, side, copy_estimator["rng"])
+        idx = np.flatnonzero(copy_estimator["alive"])
+        new_dist, near = cKDTree(copy_estimator["xy"][idx]).query(new_samples)
+        reach = new_dist <= copy_estimator["margin"] + side
+        copy_estimator["cells"] = np.vstack((cells, candidates[reach]))
+        copy_estimator["samples"] = np.vstack((samples, new_samples[reach]))
+        copy_estimator["dist"] = np.concatenate((dist, new_dist[reach]))
+        copy_estimator["nearest"] = np.concatenate((nearest, idx[near[reach]]))
+    return copy_estimator
+
+
+def estimate_buffer_area(main_estimator, radius):
+    """Returns the estimated area of the union of buffers of a radius
+
+    Parameters
+    ----------
+    main_estimator : dict
+        State returned by buffer_area_estimator
+    radius : float
+        Value of teh desired radius of buffers, at most the margin
+        of the estimator
+
+    Returns
+    -------
+    tuple
+        (area, error) where error is a deterministic bound of the
+        absolute error for the grid method and a 95% confidence
+        half-width for the montecarlo method
+
+    """
+    side = main_estimator["side"]
+    dist = main_estimator["dist"]
+    area = np.count_nonzero(dist <= radius) * side ** 2
+    # Cells crossed by the boundary of the union of buffers
+    boundary = np.count_nonzero(np.abs(dist - radius) <= side * np.sqrt(2) / 2)
+    if main_estimator["method"] == "montecarlo":
+        error = 1.96 * np.sqrt(boundary / 4) * side ** 2
+    else:
+        error = boundary * side ** 2
+    return area, error
+
+
+def approx_buffer_area(main_T, radius, estimator=None, method="grid", resolution=8):
+    """Given a MST returns the estimated buffer area with desired radius,
+    reusing the estimator of a previous call when possible
+
+    The estimator is rebuilt when the radius is out of the range
+    where it keeps its resolution (between half the margin and the margin)
+
+    Parameters
+    ----------
+    main_T : networkx.classes.graph.Graph
+        A networkx Graph object of type tree
+        with nodes and weighted arcs
+    radius : float
+        Value of teh desired radius of buffers
+    estimator : dict, optional
+        State returned by a previous call for a tree that main_T comes
+        from by pruning or inserting nodes
+    method : str
+        "grid" or "montecarlo", see buffer_area_estimator
+    resolution : int
+        See buffer_area_estimator
+
+    Returns
+    -------
+    tuple
+        (area, estimator)
+
+    """
+    if radius <= 0:
+        return 0.0, estimator
+    if estimator is None or not estimator["margin"] / 2 <= radius <= estimator["margin"]:
+        estimator = buffer_area_estimator(main_T, radius, resolution, method)
+    else:
+        estimator = update_buffer_area_estimator(estimator, main_T)
+    area, _ = estimate_buffer_area(estimator, radius)
+    return area, estimator
+
+
 def identify_poly_inter(main_loc_hull):
     """Return a list of sets with the keys of the polygons that intersect
     each other
@@ -108,6 +552,15 @@ def identify_poly_inter(main_loc_hull):
     """
 
     copy_loc_hull = main_loc_hull.copy()
+    if SHAPELY_2:
+        # Pairs of intersecting polygons from a spatial index
+        keys = list(copy_loc_hull.keys())
+        tree = shapely.STRtree(list(copy_loc_hull.values()))
+        left, right = tree.query(list(copy_loc_hull.values()), predicate="intersects")
+        order = np.lexsort((right, left))
+        groups = np.split(right[order], np.searchsorted(left[order], np.arange(1, len(keys))))
+        set_list = [{keys[j] for j in group} for group in groups]
+        return set_integration(set_list)
     gs = gpd.GeoSeries(copy_loc_hull)
     inter_dict = {loc: gs.intersects(copy_loc_hull[loc]) for loc in gs.index.values}
     inter_df = pd.DataFrame(inter_dict).replace(False, np.nan)
@@ -116,6 +569,45 @@ def identify_poly_inter(main_loc_hull):
     return set_list
 
 
+def clip_poly_inter(main_loc_hull, poly_inter):
+    """Removes the overlapping areas between intersecting polygons
+
+    In every set of intersecting polygons, polygons are processed from
+    the smallest to the biggest area and every polygon loses the area
+    it shares with the smaller ones, keeping its biggest part (see
+    filter_multipolygon). Polygons may still touch each other. Polygons
+    left without area (covered by their neighbours) are dropped
+
+    Parameters
+    ----------
+    main_loc_hull : dict with values as shapely.geometry.polygon.Polygon
+        Dictionary with int keys as location and polygons as
+        values
+    poly_inter : list of set
+        Sets of intersecting polygons, see identify_poly_inter
+
+    Returns
+    -------
+    dict with values as shapely.geometry.polygon.Polygon
+        Same keys as main_loc_hull but the dropped polygons
+
+    """
+    copy_loc_hull = main_loc_hull.copy()
+    for my_set in poly_inter:
+        kept = []
+        for key in sorted(my_set, key=lambda key: copy_loc_hull[key].area):
+            hull = copy_loc_hull[key]
+            for other in kept:
+                if hull is not None and hull.intersects(other):
+                    hull = filter_multipolygon(hull.difference(other))
+            if hull is None or hull.is_empty:
+                del copy_loc_hull[key]
+                continue
+            copy_loc_hull[key] = hull
+            kept.append(hull)
+    return copy_loc_hull
+
+
 def add_pts(polygon, N):
     """Creates N additional random points over boundaries of polygon
 
@@ -140,6 +632,41 @@ def add_pts(polygon, N):
     )
     return pts
 
+
+def all_add_pts(main_loc_hull, N):
+    """Returns the points of add_pts for every polygon
+
+    With Shapely 2 the points of all polygons are interpolated in
+    one call
+
+    Parameters
+    ----------
+    main_loc_hull : dict with values as shapely.geometry.polygon.Polygon
+        Dictionary with int keys as location and polygons as
+        values
+    N : int
+        Number of points desired to discretize the boundaries of a polygon
+
+    Returns
+    -------
+    dict with values as shapely.geometry.MultiPoint
+
+    """
+    if not SHAPELY_2 or len(main_loc_hull) == 0:
+        return {key: add_pts(value, N) for key, value in main_loc_hull.items()}
+    rings = shapely.get_exterior_ring(np.array(list(main_loc_hull.values()), dtype=object))
+    interpolated = shapely.line_interpolate_point(
+        rings[:, np.newaxis], np.linspace(0, 1, N + 1)[np.newaxis, :], normalized=True
+    )
+    ring_coords, ring_index = shapely.get_coordinates(rings, return_index=True)
+    # Interpolated points first and then the vertices, as in add_pts
+    all_coords = np.concatenate([shapely.get_coordinates(interpolated.ravel()), ring_coords])
+    all_index = np.concatenate([np.repeat(np.arange(rings.size), N + 1), ring_index])
+    order = np.argsort(all_index, kind="stable")
+    pts = shapely.multipoints(all_coords[order], indices=all_index[order])
+    return dict(zip(main_loc_hull.keys(), pts))
+
+
 def filter_multipolygon(polygon):
     """If polygon returns the same polygon, if multipolygon returns the
     biggest polygon in the geometry collection
@@ -155,9 +682,245 @@ def filter_multipolygon(polygon):
     
     """
     if type(polygon) == shapely.geometry.multipolygon.MultiPolygon:
-        new_polygon = max(polygon, key=lambda x: x.area)
+        new_polygon = max(polygon.geoms, key=lambda x: x.area)
     elif type(polygon) == shapely.geometry.polygon.Polygon:
         new_polygon = polygon
     else:
         new_polygon = None
     return new_polygon
+
+
+def all_filter_multipolygon(main_loc_hull):
+    """Applies filter_multipolygon to every polygon
+
+    With Shapely 2 the parts of all multipolygons are compared in
+    one call
+
+    Parameters
+    ----------
+    main_loc_hull : dict with values as shapely.geometry.polygon.Polygon
+        Dictionary with int keys as location and polygons or
+        multipolygons as values
+
+    Returns
+    -------
+    dict with values as shapely.geometry.polygon.Polygon
+
+    """
+    if not SHAPELY_2 or len(main_loc_hull) == 0:
+        return {key: filter_multipolygon(value) for key, value in main_loc_hull.items()}
+    geoms = np.array(list(main_loc_hull.values()), dtype=object)
+    type_ids = shapely.get_type_id(geoms)
+    new_geoms = np.where(type_ids == shapely.GeometryType.POLYGON, geoms, None)
+    multi = np.flatnonzero(type_ids == shapely.GeometryType.MULTIPOLYGON)
+    parts, index = shapely.get_parts(geoms[multi], return_index=True)
+    if parts.size > 0:
+        # First part with the biggest area of every multipolygon, as max does
+        order = np.lexsort((np.arange(parts.size), -shapely.area(parts), index))
+        first = order[np.r_[True, index[order][1:] != index[order][:-1]]]
+        new_geoms[multi[index[first]]] = parts[first]
+    return dict(zip(main_loc_hull.keys(), new_geoms))
+
+
+def polygon_vertices(polygon):
+    """Returns the number of vertices of a polygon or multipolygon, the
+    closing vertex of every ring is not counted
+
+    Parameters
+    ----------
+    polygon : shapely.geometry.Multipolygon or shapely.geometry.Polygon
+
+    Returns
+    -------
+    int
+
+    """
+    if polygon is None or polygon.is_empty:
+        return 0
+    parts = polygon.geoms if hasattr(polygon, "geoms") else [polygon]
+    vertices = sum(
+        len(part.exterior.coords) - 1 + sum(len(ring.coords) - 1 for ring in part.interiors)
+        for part in parts
+    )
+    return vertices
+
+
+def shared_edges(main_loc_hull, snap=1e-6):
+    """Splits the boundaries of the polygons into edges that are shared by
+    the same polygons along all their length
+
+    Edges end where three or more boundaries meet, so a boundary between
+    two neighbours is a single edge that appears once
+
+    Parameters
+    ----------
+    main_loc_hull : dict with values as shapely.geometry.polygon.Polygon
+        Dictionary with int keys as location and polygons as values
+    snap : float
+        Distance in CRS units under which an edge lies on a boundary
+
+    Returns
+    -------
+    tuple
+        (edges, owners) where edges is a list of
+        shapely.geometry.LineString and owners has the list of keys of
+        the polygons of every edge
+
+    """
+    loc_hull = {
+        key: hull for key, hull in main_loc_hull.items() if hull is not None and not hull.is_empty
+    }
+    if len(loc_hull) == 0:
+        return [], []
+    # The union nodes the boundaries and keeps every shared piece once
+    lines = shapely.ops.unary_union([hull.boundary for hull in loc_hull.values()])
+    lines = list(lines.geoms) if hasattr(lines, "geoms") else [lines]
+    merged = shapely.ops.linemerge(lines)
+    edges = list(merged.geoms) if hasattr(merged, "geoms") else [merged]
+    keys = list(loc_hull)
+    boundaries = [hull.boundary for hull in loc_hull.values()]
+    bounds = np.array([hull.bounds for hull in loc_hull.values()])
+    owners = []
+    for edge in edges:
+        mid = edge.interpolate(0.5, normalized=True)
+        near = np.flatnonzero(
+            (bounds[:, 0] - snap <= mid.x) & (bounds[:, 2] + snap >= mid.x)
+            & (bounds[:, 1] - snap <= mid.y) & (bounds[:, 3] + snap >= mid.y)
+        )
+        owners.append([keys[i] for i in near if boundaries[i].distance(mid) <= snap])
+    return edges, owners
+
+
+def simplify_edges(edges, tolerances):
+    """Simplifies every edge with its own tolerance keeping its ends
+
+    Parameters
+    ----------
+    edges : list of shapely.geometry.LineString
+        Edges, see shared_edges
+    tolerances : list of float
+        Douglas-Peucker tolerance of every edge in CRS units
+
+    Returns
+    -------
+    list of shapely.geometry.LineString
+
+    """
+    new_edges = []
+    for edge, tolerance in zip(edges, tolerances):
+        new_edge = edge.simplify(tolerance, preserve_topology=True) if tolerance > 0 else edge
+        # A closed edge (a polygon without neighbours) keeps its ring
+        if edge.is_closed and len(new_edge.coords) < 4:
+            new_edge = edge
+        new_edges.append(new_edge)
+    return new_edges
+
+
+def budget_tolerance(edges, max_vertices, steps=32):
+    """Returns the smallest tolerance, up to a bisection, that simplifies
+    the edges of a polygon to max_vertices vertices or fewer
+
+    Parameters
+    ----------
+    edges : list of shapely.geometry.LineString
+        Edges of the boundary of the polygon, see shared_edges
+    max_vertices : int
+        Vertex budget of the polygon
+    steps : int
+        Number of bisection steps
+
+    Returns
+    -------
+    float
+        Tolerance in CRS units, the largest one tried if the budget can
+        not be met because of the ends of the edges
+
+    """
+    def vertices(tolerance):
+        return sum(
+            len(edge.coords) - 1 for edge in simplify_edges(edges, [tolerance] * len(edges))
+        )
+
+    if len(edges) == 0 or vertices(0.0) <= max_vertices:
+        return 0.0
+    low = 0.0
+    # Every vertex of an edge is closer than the diagonal of its bounds
+    high = max(
+        np.hypot(edge.bounds[2] - edge.bounds[0], edge.bounds[3] - edge.bounds[1])
+        for edge in edges
+    )
+    if vertices(high) > max_vertices:
+        return high
+    for _ in range(steps):
+        middle = (low + high) / 2
+        if vertices(middle) <= max_vertices:
+            high = middle
+        else:
+            low = middle
+    return high
+
+
+def polygonize_edges(edges, main_loc_hull):
+    """Rebuilds the polygons from the faces enclosed by a set of edges
+
+    Every face covered at least a half by the polygons goes to the one
+    that covers most of its area, even if it covers less than a half
+    (e.g. where a simplified edge crosses a junction), so no gap is
+    opened between neighbours. The other faces (gaps and holes of the
+    polygons) are dropped. Multipolygons are only kept where the original
+    polygon was one, otherwise the biggest part is kept (see
+    filter_multipolygon) and the other parts go to the rebuilt neighbour
+    with the longest shared boundary, if any
+
+    Parameters
+    ----------
+    edges : list of shapely.geometry.LineString
+        Edges, e.g. simplified with simplify_edges
+    main_loc_hull : dict with values as shapely.geometry.polygon.Polygon
+        Original polygons
+
+    Returns
+    -------
+    dict with values as shapely.geometry.polygon.Polygon
+        Same keys as main_loc_hull, polygons without faces keep their
+        original geometry
+
+    """
+    copy_loc_hull = main_loc_hull.copy()
+    keys = [key for key, hull in copy_loc_hull.items() if hull is not None and not hull.is_empty]
+    if len(keys) == 0:
+        return copy_loc_hull
+    bounds = np.array([copy_loc_hull[key].bounds for key in keys])
+    # Edges that cross after the simplification are noded again
+    lines = shapely.ops.unary_union(edges)
+    faces = shapely.ops.polygonize(list(lines.geoms) if hasattr(lines, "geoms") else [lines])
+    loc_faces = {key: [] for key in keys}
+    for face in faces:
+        minx, miny, maxx, maxy = face.bounds
+        near = np.flatnonzero(
+            (bounds[:, 0] <= maxx) & (bounds[:, 2] >= minx)
+            & (bounds[:, 1] <= maxy) & (bounds[:, 3] >= miny)
+        )
+        if near.size == 0:
+            continue
+        areas = [face.intersection(copy_loc_hull[keys[i]]).area for i in near]
+        if sum(areas) >= 0.5 * face.area:
+            loc_faces[keys[near[int(np.argmax(areas))]]].append(face)
+    parts = []
+    for key, faces in loc_faces.items():
+        if len(faces) == 0:
+            continue
+        new_hull = shapely.ops.unary_union(faces)
+        if copy_loc_hull[key].geom_type == "Polygon":
+            new_hull = filter_multipolygon(new_hull)
+            parts += [face for face in faces if not new_hull.contains(face.representative_point())]
+        copy_loc_hull[key] = new_hull
+    rebuilt = [key for key, faces in loc_faces.items() if len(faces) > 0]
+    for face in parts:
+        lengths = [
+            face.boundary.intersection(copy_loc_hull[key].boundary).length for key in rebuilt
+        ]
+        if max(lengths, default=0.0) > 0:
+            key = rebuilt[int(np.argmax(lengths))]
+            copy_loc_hull[key] = shapely.ops.unary_union([copy_loc_hull[key], face])
+    return copy_loc_hull
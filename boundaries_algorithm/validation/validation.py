@@ -2,6 +2,8 @@
 A module for validating coordinates in GIS
 based on polygon generation
 """
+import time
+import warnings
 import numpy as np
 import pandas as pd
 import networkx as nx
@@ -13,6 +15,10 @@ from sklearn.metrics.pairwise import euclidean_distances
 from boundaries_algorithm.validation.np_module import (
     all_weight_arcs,
     node_attributes_generation,
+    collapse_coordinates,
+    knn_outliers,
+    coreset_cell_size,
+    block_weight_arcs,
 )
 from boundaries_algorithm.validation.pd_module import (
     sub_df_mask
@@ -20,16 +26,31 @@ from boundaries_algorithm.validation.pd_module import (
 
 from boundaries_algorithm.validation.nx_module import (
     mst,
+    streaming_mst,
     mst_pruning,
     all_rmc_mean,
     prune_node_tree,
+    batch_size_schedule,
+    select_prune_nodes,
+    insert_node_tree,
 )
 from boundaries_algorithm.validation.poly_module import (
     convex_hull,
+    all_convex_hull,
     identify_poly_inter,
-    add_pts,
-    filter_multipolygon
+    all_add_pts,
+    all_filter_multipolygon,
+    add_onion_layers,
+    refresh_onion_layers,
+    clip_poly_inter,
+    shared_edges,
+    simplify_edges,
+    budget_tolerance,
+    polygonize_edges,
+    polygon_vertices,
+    SHAPELY_2,
 )
+from boundaries_algorithm.store_module import save_checkpoint, load_checkpoint, remove_checkpoint
 
 def dict_filter_multipoligon(main_loc_hull):
     """ Function that avoids having multipoligons in dictionary
@@ -45,13 +66,107 @@ def dict_filter_multipoligon(main_loc_hull):
 
     """
     copy_loc_hull = main_loc_hull.copy()
-    new_loc_hull = {
-        key: filter_multipolygon(value) for key, value in copy_loc_hull.items()
-    }
+    new_loc_hull = all_filter_multipolygon(copy_loc_hull)
     return new_loc_hull
 
 
-def polygons_init(main_df, column_id, threshold_N, buffer_area, convert_1, convert_2):
+def mst_init(
+    main_df, column_id, convert_1, convert_2, epsilon=None, hull_layers=None,
+    outlier_k=None, outlier_factor=10.0, max_nodes=None, max_memory=None,
+    dtype=np.float64
+):
+    """Returns a dictionary with the minimum spanning tree of every location
+
+    Parameters
+    ----------
+    main_df : pandas.core.frame.DataFrame
+        DataFrame that contains all the information of nodes
+        (i.e. coordinates)
+    column_id : str
+        column from the DataFrame that contains node locations
+    epsilon : float, optional
+        If given, nodes in the same square cell of side epsilon (identical
+        coordinates if 0) are collapsed into one node before building the
+        MST. The node keeps the number of collapsed nodes as count attribute
+        and their ids as members attribute
+    hull_layers : int, optional
+        If given, the number of onion layers computed for every tree so
+        convex hulls are updated from the outer layers after pruning
+        (see add_onion_layers)
+    outlier_k : int, optional
+        If given, nodes far away from their outlier_k nearest neighbours
+        of the same location (see knn_outliers) are dropped before building
+        the MST. Their ids are saved in the outliers graph attribute, see
+        tree_outliers
+    outlier_factor : float
+        See knn_outliers
+    max_nodes : int, optional
+        If given, locations with more nodes are collapsed as with epsilon
+        in cells big enough to leave at most max_nodes nodes (see
+        coreset_cell_size), which bounds the cost of the MST and its
+        pruning. The side of the cells is saved in the cell_size graph
+        attribute and the largest distance from a node to the node that
+        represents it (the diagonal of the cells) in error_bound
+    max_memory : int, optional
+        If given, the arcs are computed in blocks of about max_memory bytes
+        (see block_weight_arcs) and merged with streaming_mst, so the n x n
+        matrix of distances is never built
+    dtype : numpy.dtype
+        Type of the weights of the blocks when max_memory is given
+
+    Returns
+    -------
+    dict with values as networkx.classes.graph.Graph
+        Dictionary with locations as keys and unpruned trees as values
+
+    """
+    copy_df = main_df.copy()
+    loc_mst = {}
+    locs = copy_df[column_id].unique()
+    for loc in locs:
+        sub_df = sub_df_mask(
+            copy_df, [convert_1, convert_2], copy_df[column_id] == loc
+        )
+        nodes = sub_df.index.values
+        X = sub_df[convert_1].values
+        Y = sub_df[convert_2].values
+        outliers = nodes[:0]
+        if outlier_k is not None:
+            mask = knn_outliers(X, Y, outlier_k, outlier_factor)
+            outliers = nodes[mask]
+            nodes, X, Y = nodes[~mask], X[~mask], Y[~mask]
+        cell_size = epsilon
+        if max_nodes is not None:
+            cell_size = coreset_cell_size(X, Y, max_nodes, epsilon or 0.0)
+        if cell_size is not None:
+            nodes, X, Y, counts, members = collapse_coordinates(nodes, X, Y, cell_size)
+        node_attributes = node_attributes_generation(nodes, X, Y)
+        if max_memory is None:
+            arcs = all_weight_arcs(nodes, X, Y, euclidean_distances)
+            T = mst(arcs, node_attributes)
+        else:
+            arc_blocks = block_weight_arcs(X, Y, euclidean_distances, max_memory, dtype)
+            T = streaming_mst(nodes, arc_blocks, node_attributes)
+        if cell_size is not None:
+            nx.set_node_attributes(T, dict(zip(nodes, counts)), name="count")
+            nx.set_node_attributes(T, members, name="members")
+        if max_nodes is not None:
+            T.graph["cell_size"] = cell_size
+            T.graph["error_bound"] = np.sqrt(2) * cell_size
+        if outlier_k is not None:
+            T.graph["outliers"] = outliers
+        if hull_layers is not None:
+            T = add_onion_layers(T, hull_layers)
+        loc_mst[loc] = T
+    return loc_mst
+
+
+def polygons_init(
+    main_df, column_id, threshold_N, buffer_area, convert_1, convert_2, epsilon=None,
+    batch_size=1, leaf_quantile=None, buffer_method=None, buffer_resolution=8,
+    hull_layers=None, outlier_k=None, outlier_factor=10.0, max_nodes=None,
+    max_memory=None, dtype=np.float64
+):
 
     """Returns dictionaries of polygons and trees based
     on DataFrame and subset.
@@ -71,34 +186,58 @@ def polygons_init(main_df, column_id, threshold_N, buffer_area, convert_1, conve
     threshold_N : float
         Percentage of N that represents the minimum number of nodes
         that can have a tree
+    epsilon : float, optional
+        Collapse of coincident nodes, see mst_init
+    batch_size : int, float or function
+        Number of nodes pruned per iteration, see mst_pruning
+    leaf_quantile : float, optional
+        See mst_pruning
+    buffer_method : str, optional
+        Estimator of the buffer area used as stop criterion, see mst_pruning
+    buffer_resolution : int
+        Accuracy of the buffer area estimator, see mst_pruning
+    hull_layers : int, optional
+        Onion layers of the trees, see mst_init. They are computed again
+        after pruning so poly_no_inter starts with intact layers
+    outlier_k : int, optional
+        Pre-filter of outliers before the MST, see mst_init
+    outlier_factor : float
+        See knn_outliers
+    max_nodes : int, optional
+        Sample budget per location, see mst_init. Hulls are built from
+        the collapsed nodes, ident_good_proj still classifies every node
+    max_memory : int, optional
+        Memory bound of the arcs of every MST, see mst_init
+    dtype : numpy.dtype
+        See mst_init
 
     Returns
     -------
 
     
     """
-    copy_df = main_df.copy()
-    loc_hull = {}
     loc_tree = {}
-    locs = copy_df[column_id].unique()
-    for loc in locs:
-        sub_df = sub_df_mask(
-            copy_df, [convert_1, convert_2], copy_df[column_id] == loc
+    loc_mst = mst_init(
+        main_df, column_id, convert_1, convert_2, epsilon, hull_layers, outlier_k,
+        outlier_factor, max_nodes, max_memory, dtype
+    )
+    for loc, T in loc_mst.items():
+        T = mst_pruning(
+            T, threshold_N, buffer_area, batch_size, leaf_quantile, buffer_method,
+            buffer_resolution
         )
-        nodes = sub_df.index.values
-        X = sub_df[convert_1].values
-        Y = sub_df[convert_2].values
-        arcs = all_weight_arcs(nodes, X, Y, euclidean_distances)
-        node_attributes = node_attributes_generation(nodes, X, Y)
-        T = mst(arcs, node_attributes)
-        T = mst_pruning(T, threshold_N, buffer_area)
+        if hull_layers is not None:
+            T = add_onion_layers(T, hull_layers)
         # Save important information
         loc_tree[loc] = T
-        loc_hull[loc] = convex_hull(T)
+    loc_hull = all_convex_hull(loc_tree)
     return loc_hull, loc_tree
 
 
-def poly_no_inter(main_loc_hull, main_loc_tree):
+def poly_no_inter(
+    main_loc_hull, main_loc_tree, batch_size=1, checkpoint_path=None,
+    checkpoint_every=100, resume=False, time_budget=None
+):
     """Eliminate intersections between polygons making them smaller
     
     Function that uses the prune_node_tree to iteratively prune nodes
@@ -113,19 +252,62 @@ def poly_no_inter(main_loc_hull, main_loc_tree):
     main_loc_tree : dict with values as networkx.classes.graph.Graph
         Dictionary with int keys as location and tree graphs as
         values
-        
+    batch_size : int, float or function
+        Number of nodes pruned per iteration from the polygon with
+        biggest area, see batch_size_schedule. They are the nodes that
+        the single step pruning would take from that polygon (see
+        select_prune_nodes), but the polygon and the intersections are
+        only checked again every batch_size nodes, so polygons may end
+        up to batch_size - 1 nodes smaller than with single step pruning
+    checkpoint_path : str, optional
+        If given, directory where the polygons, trees, iteration and
+        intersecting sets are saved every checkpoint_every iterations
+        and when the time budget runs out, see save_checkpoint. The
+        checkpoint is removed when no intersections are left, so it
+        only remains after a stop
+    checkpoint_every : int
+        Number of iterations between checkpoints
+    resume : bool
+        If True and checkpoint_path has a checkpoint, the pruning goes
+        on from it instead of main_loc_hull and main_loc_tree. Trees
+        loaded from a checkpoint lose the members attribute
+    time_budget : float, optional
+        Seconds after which the pruning stops with a warning. The
+        remaining overlapping areas are then removed with
+        clip_poly_inter, so the returned polygons do not overlap but
+        may not be the convex hulls of the returned trees, and the
+        locations covered by their neighbours have no polygon
 
     Returns
     -------
 
     
     """
-    copy_loc_hull = main_loc_hull.copy()
-    copy_loc_tree = main_loc_tree.copy()
+    start = time.perf_counter()
+    checkpoint = (
+        load_checkpoint(checkpoint_path) if resume and checkpoint_path is not None else None
+    )
+    if checkpoint is None:
+        copy_loc_hull = main_loc_hull.copy()
+        copy_loc_tree = main_loc_tree.copy()
+        iteration = 0
+    else:
+        copy_loc_hull, copy_loc_tree, iteration, _ = checkpoint
     poly_inter = identify_poly_inter(copy_loc_hull)
     # At the end all sets must have only one element
     flag = all(len(my_set) == 1 for my_set in poly_inter)
     while not flag:
+        if time_budget is not None and time.perf_counter() - start > time_budget:
+            if checkpoint_path is not None:
+                save_checkpoint(checkpoint_path, copy_loc_hull, copy_loc_tree, iteration, poly_inter)
+            clip_loc_hull = clip_poly_inter(copy_loc_hull, poly_inter)
+            dropped = [key for key in copy_loc_hull if key not in clip_loc_hull]
+            warnings.warn(
+                f"poly_no_inter stopped after {iteration} iterations, "
+                f"overlapping areas were clipped and {len(dropped)} polygons "
+                f"covered by their neighbours were dropped {dropped}"
+            )
+            return clip_loc_hull, copy_loc_tree
         # Get biggest set
         my_set = max(poly_inter, key=len)
         # Extract from important dicts the info of set
@@ -145,10 +327,15 @@ def poly_no_inter(main_loc_hull, main_loc_tree):
         loc = max(sub_loc_hull_area, key=sub_loc_hull_area.get)
         # Get the tree of the loc with biggest area
         T = sub_loc_tree[loc]
-        # Prune tree
+        # Prune tree keeping at least 3 nodes
         rmc_mean = all_rmc_mean(T)
-        u = rmc_mean.idxmax()
-        T = prune_node_tree(T, u)
+        k = batch_size_schedule(batch_size, iteration, T.number_of_nodes())
+        k = min(k, T.number_of_nodes() - 3)
+        nodes = select_prune_nodes(T, rmc_mean, k)
+        for node in nodes:
+            T = prune_node_tree(T, node)
+        T = refresh_onion_layers(T)
+        iteration += 1
         # Update tree object in principal dict
         copy_loc_tree[loc] = T
         # Get convex hull
@@ -159,9 +346,86 @@ def poly_no_inter(main_loc_hull, main_loc_tree):
         poly_inter = identify_poly_inter(copy_loc_hull)
         # Evaluate if all sets are of len 1
         flag = all(len(my_set) == 1 for my_set in poly_inter)
+        if checkpoint_path is not None and iteration % checkpoint_every == 0:
+            save_checkpoint(checkpoint_path, copy_loc_hull, copy_loc_tree, iteration, poly_inter)
+    if checkpoint_path is not None:
+        remove_checkpoint(checkpoint_path)
     return copy_loc_hull, copy_loc_tree
 
 
+def insert_points(
+    main_loc_hull, main_loc_tree, main_df, column_id, convert_1, convert_2, cones=8,
+    buffer_method="grid", buffer_resolution=8, **inter_options
+):
+    """Adds new nodes to the trees of their locations without building
+    the trees again
+
+    Every node is inserted in the tree of its location with
+    insert_node_tree, updating a copy of the tree and its buffer area
+    estimator in place, only the hulls of the locations that changed are
+    computed again and then poly_no_inter removes the new intersections.
+    Locations without tree are ignored, smooth_polygons has to run again
+    to update the smoothed polygons
+
+    Parameters
+    ----------
+    main_loc_hull : dict with values as shapely.geometry.polygon.Polygon
+        Dictionary with int keys as location and polygons as
+        values, see poly_no_inter
+    main_loc_tree : dict with values as networkx.classes.graph.Graph
+        Dictionary with int keys as location and tree graphs as
+        values, see poly_no_inter
+    main_df : pandas.core.frame.DataFrame
+        DataFrame with the new nodes as index and projected coordinates
+    column_id : str
+        column from the DataFrame that contains node locations
+    cones : int
+        See insert_node_mst
+    buffer_method : str, optional
+        See insert_node_tree
+    buffer_resolution : int
+        See insert_node_tree
+    inter_options :
+        Keyword arguments of poly_no_inter
+
+    Returns
+    -------
+    tuple
+        Polygons, trees and a boolean array aligned with main_df, True for
+        the nodes added to their tree
+
+    """
+    copy_loc_hull = main_loc_hull.copy()
+    copy_loc_tree = main_loc_tree.copy()
+    accepted = np.zeros(main_df.shape[0], dtype=bool)
+    changed = set()
+    rows = zip(
+        main_df.index.values,
+        main_df[column_id].values,
+        main_df[convert_1].values,
+        main_df[convert_2].values,
+    )
+    # Buffer area estimator of every location, reused between nodes
+    estimators = {}
+    for i, (node, loc, x, y) in enumerate(rows):
+        if loc not in copy_loc_tree:
+            continue
+        if loc not in estimators:
+            # The tree is copied once and then updated in place
+            copy_loc_tree[loc] = copy_loc_tree[loc].copy()
+            estimators[loc] = None
+        copy_loc_tree[loc], accepted[i], estimators[loc] = insert_node_tree(
+            copy_loc_tree[loc], node, (x, y), cones, buffer_method, buffer_resolution,
+            estimators[loc], copy=False
+        )
+        if accepted[i]:
+            changed.add(loc)
+    copy_loc_hull.update(all_convex_hull({loc: copy_loc_tree[loc] for loc in changed}))
+    # Only the sets of intersecting polygons are pruned
+    copy_loc_hull, copy_loc_tree = poly_no_inter(copy_loc_hull, copy_loc_tree, **inter_options)
+    return copy_loc_hull, copy_loc_tree, accepted
+
+
 def smooth_polygons(main_loc_hull, N):
     """Generates thiessen polygons using interpolation of conex hulls
 
@@ -182,8 +446,8 @@ def smooth_polygons(main_loc_hull, N):
     """
     copy_loc_hull = main_loc_hull.copy()
     # Get envelope fo thiessen polygons
-    hull_pts = {key: add_pts(value, N) for key, value in copy_loc_hull.items()}
-    pts = shapely.ops.unary_union(hull_pts.values())
+    hull_pts = all_add_pts(copy_loc_hull, N)
+    pts = shapely.ops.unary_union(list(hull_pts.values()))
     hull = pts.convex_hull
     loc_union_region = {}
 
@@ -217,12 +481,125 @@ def smooth_polygons(main_loc_hull, N):
 
     return copy_loc_hull
 
-def ident_good_proj(main_df, main_loc_hull, column_id, convert_1, convert_2):
+def compact_polygons(main_loc_hull, tolerance=None, max_vertices=None, snap=1e-6, rounds=8):
+    """Simplifies the polygons to a tolerance or a vertex budget keeping
+    the boundaries between neighbours shared
+
+    The boundaries are split into edges shared by the same polygons (see
+    shared_edges), every edge is simplified once keeping its ends and
+    the polygons are rebuilt from the faces of the simplified edges
+    (see polygonize_edges), so neighbours get the same boundary and no
+    overlap or gap is created between them
+
+    Parameters
+    ----------
+    main_loc_hull : dict with values as shapely.geometry.polygon.Polygon
+        Dictionary with int keys as location and polygons as values,
+        e.g. the output of smooth_polygons
+    tolerance : float, optional
+        Douglas-Peucker tolerance of all the edges in CRS units
+    max_vertices : int, optional
+        Vertex budget of every polygon. The tolerance of every polygon
+        is found with budget_tolerance and a shared edge uses the
+        largest tolerance of its polygons (and at least tolerance).
+        Rebuilding the polygons can add vertices where simplified edges
+        cross, so the vertices are counted again and the budget of the
+        polygons above it is lowered by the excess, up to rounds times.
+        The budget can not be met by polygons with more junctions with
+        their neighbours (ends of edges) than max_vertices, nor by the
+        neighbours of a flattened polygon (see rounds) if they need a
+        larger tolerance on the edges they share with it
+    snap : float
+        See shared_edges
+    rounds : int
+        Maximum number of times the polygons are rebuilt to meet
+        max_vertices. A polygon flattened to no area by the larger
+        tolerances of its neighbours is rebuilt with its own tolerance
+        on its edges, halved every time it is flattened again, and
+        with its edges unchanged after the last round
+
+    Returns
+    -------
+    dict with values as shapely.geometry.polygon.Polygon
+        Compacted polygons, a copy of main_loc_hull if neither tolerance
+        nor max_vertices are given
+
+    """
+    copy_loc_hull = main_loc_hull.copy()
+    if tolerance is None and max_vertices is None:
+        return copy_loc_hull
+    edges, owners = shared_edges(copy_loc_hull, snap)
+    min_tolerance = 0.0 if tolerance is None else tolerance
+    loc_tolerance = {key: min_tolerance for key in copy_loc_hull}
+    loc_budget = {key: max_vertices for key in copy_loc_hull}
+    # Tolerance of the edges of the polygons flattened by their neighbours
+    loc_cap = {}
+    changed = list(copy_loc_hull) if max_vertices is not None else []
+    for i in range(rounds + 1):
+        for key in changed:
+            loc_edges = [edge for edge, owner in zip(edges, owners) if key in owner]
+            loc_tolerance[key] = max(
+                min_tolerance, budget_tolerance(loc_edges, max(loc_budget[key], 0))
+            )
+        edge_tolerances = []
+        for owner in owners:
+            shared = max([loc_tolerance[key] for key in owner], default=min_tolerance)
+            caps = [loc_cap[key] for key in owner if key in loc_cap]
+            edge_tolerances.append(min([shared] + caps))
+        new_loc_hull = polygonize_edges(simplify_edges(edges, edge_tolerances), copy_loc_hull)
+        # Polygons without faces keep the same object, see polygonize_edges
+        flat = [
+            key for key, hull in new_loc_hull.items()
+            if hull is not None and not hull.is_empty and hull is copy_loc_hull[key]
+        ]
+        for key in flat:
+            # Last round without simplifying their edges
+            if i == rounds - 1:
+                loc_cap[key] = 0.0
+            else:
+                loc_cap[key] = loc_cap.get(key, 2 * loc_tolerance[key]) / 2
+        changed = []
+        if max_vertices is not None:
+            excess = {
+                key: polygon_vertices(hull) - max_vertices for key, hull in new_loc_hull.items()
+            }
+            # Polygons already simplified to their junctions can not lose more vertices
+            changed = [
+                key for key in excess
+                if excess[key] > 0 and loc_budget[key] > 0 and key not in flat
+            ]
+            for key in changed:
+                loc_budget[key] -= excess[key]
+        if len(flat) == 0 and (len(changed) == 0 or i >= rounds - 1):
+            break
+    return new_loc_hull
+
+
+def tree_outliers(main_loc_tree):
+    """Returns the ids of the outliers dropped from every tree
+
+    Parameters
+    ----------
+    main_loc_tree : dict with values as networkx.classes.graph.Graph
+        Dictionary with int keys as location and tree graphs as
+        values, see mst_init
+
+    Returns
+    -------
+    numpy.ndarray
+        Ids saved in the outliers graph attribute of the trees
+
+    """
+    outliers = [T.graph["outliers"] for T in main_loc_tree.values() if "outliers" in T.graph]
+    return np.concatenate(outliers) if outliers else np.array([])
+
+
+def ident_good_proj(main_df, main_loc_hull, column_id, convert_1, convert_2, exclude=None):
     """Return an array with the id of projects inside the polygon thet
     specified
     
-    This function uses geopandas GeoSeries to efficiently determine if points
-    are within polygons
+    Nodes are classified with ident_good_mask and the DataFrames are
+    selected with the mask
 
     Parameters
     ----------
@@ -232,38 +609,63 @@ def ident_good_proj(main_df, main_loc_hull, column_id, convert_1, convert_2):
     main_loc_hull : dict with values as shapely.geometry.polygon.Polygon
         Dictionary with int keys as location and polygons as
         values
+    exclude : array-like, optional
+        Nodes that are bad wherever they are, e.g. the outliers dropped
+        by mst_init (see tree_outliers)
 
     Returns
     -------
 
     
     """
-    copy_df = main_df.copy()
+    mask = ident_good_mask(main_df, main_loc_hull, column_id, convert_1, convert_2, exclude)
+    percentage = round(100 * mask.sum() / mask.size, 2)
+    df_good = main_df.loc[mask]
+    df_bad = main_df.loc[~mask]
+    return df_good, df_bad, percentage
 
-    # GeoSerie for project points
-    gdf = gpd.GeoDataFrame(
-        copy_df[column_id],
-        index=copy_df.index.values,
-        geometry=gpd.points_from_xy(copy_df[convert_1].values, copy_df[convert_2].values),
-    )
-    # GeoSerie for polygons for good projects
-    gs = gpd.GeoSeries(main_loc_hull)
 
-    good_dict = {
-        loc: gdf.intersects(gs[loc]) * (gdf[column_id] == loc) for loc in gs.index.values
-    }
-    good_df = pd.DataFrame(good_dict).replace(False, np.nan)
-    good_df = good_df.dropna(how="all", axis=0)
-    good_proy = good_df.index.values
+def ident_good_mask(main_df, main_loc_hull, column_id, convert_1, convert_2, exclude=None):
+    """Returns a boolean mask of the nodes inside the polygon of their
+    location
 
-    percentage = round(100 * good_proy.size / gdf.shape[0], 2)
+    A node is good when it intersects the polygon of its location. Every
+    node is only checked against that polygon and no DataFrame is copied
 
-    df_good = copy_df.loc[good_proy]
-    set_good = set(good_proy)
+    Parameters
+    ----------
+    main_df : pandas.core.frame.DataFrame
+        Dataframe that contains nodes as index and columns with
+        coordinate information
+    main_loc_hull : dict with values as shapely.geometry.polygon.Polygon
+        Dictionary with int keys as location and polygons as
+        values
+    exclude : array-like, optional
+        See ident_good_proj
 
-    set_all = set(copy_df.index.values)
-    set_bad = set_all.difference(set_good)
-    bad_proy = list(set_bad)
-    df_bad = copy_df.loc[bad_proy]
+    Returns
+    -------
+    numpy.ndarray
+        Boolean array aligned with the rows of main_df
 
-    return df_good, df_bad, percentage
+    """
+    mask = np.zeros(main_df.shape[0], dtype=bool)
+    X = main_df[convert_1].values
+    Y = main_df[convert_2].values
+    # Rows of every location from one sort of the location codes
+    codes, locs = pd.factorize(main_df[column_id])
+    order = np.argsort(codes, kind="stable")
+    bounds = np.searchsorted(codes[order], np.arange(len(locs) + 1))
+    loc_idx = {loc: order[bounds[i]:bounds[i + 1]] for i, loc in enumerate(locs)}
+    for loc, hull in main_loc_hull.items():
+        idx = loc_idx.get(loc)
+        if hull is None or idx is None:
+            continue
+        if SHAPELY_2:
+            mask[idx] = shapely.intersects_xy(hull, X[idx], Y[idx])
+        else:
+            pts = gpd.GeoSeries(gpd.points_from_xy(X[idx], Y[idx]))
+            mask[idx] = pts.intersects(hull).values
+    if exclude is not None:
+        mask &= ~main_df.index.isin(exclude)
+    return mask
@@ -1,6 +1,7 @@
 """
 A module for visualizing GIS data
 """
+import os
 import numpy as np
 import folium
 from boundaries_algorithm.preprocessing_module import (
@@ -8,91 +9,138 @@ from boundaries_algorithm.preprocessing_module import (
     crs_transformation,
 )
 
-def plot_folium(loc_hull, loc_tree, df, name):
+
+def tree_segments(T, df, actual_1, actual_2):
+    """Returns the geographic coordinates of the ends of every arc of a tree
+
+    The coordinates of all the nodes are looked up at once instead of
+    once per arc
+
+    Parameters
+    ----------
+    T : networkx.classes.graph.Graph
+        Tree whose nodes are in the index of df
+    df : pandas.core.frame.DataFrame
+        DataFrame with the geographic coordinates of the nodes
+
+    Returns
+    -------
+    numpy.ndarray
+        Array of shape (arcs, 2, 2) with the (latitude, longitude) of
+        both ends of every arc
+
     """
+    arcs = np.array(list(T.edges), dtype=float).reshape(-1, 2)
+    coords = df[[actual_1, actual_2]].reindex(arcs.ravel()).values
+    return coords.reshape(-1, 2, 2)
+
+
+def plot_folium(
+    loc_hull, loc_tree, df, name, actual_epsg="epsg:4686", convert_epsg="epsg:3116",
+    column_id="zona", actual_1="latitud", actual_2="longitud", path="maps"
+):
+    """Saves a folium map with the polygons, trees and nodes of every location
+
+    Parameters
+    ----------
+    loc_hull : dict with values as shapely.geometry.polygon.Polygon
+        Polygons in the convert_epsg CRS
+    loc_tree : dict with values as networkx.classes.graph.Graph
+        Trees of the locations
+    df : pandas.core.frame.DataFrame
+        DataFrame with the geographic coordinates of the nodes
+    name : str
+        Name of the html file
+    path : str
+        Directory of the html file
+
+    Returns
+    -------
+
+    
     """
-    crs_4686 = "epsg:4686"
-    crs_3116 = "epsg:3116"
-    transformer = crs_transformer(crs_4686, crs_3116)
-    mapa_x, mapa_y = df[["latitud", "longitud"]].mean().values
+    # One transformer from the projected CRS for all the polygons
+    transformer = crs_transformer(convert_epsg, actual_epsg)
+    mapa_x, mapa_y = df[[actual_1, actual_2]].mean().values
     m = folium.Map(location=(mapa_x, mapa_y), zoom_start=12, tiles="cartodbpositron")
     colors = ["chocolate","blue","grey","purple"]
-    for key, value in loc_hull.items():
-        color = colors.pop()
-        cluster = folium.FeatureGroup(name=key, show=False).add_to(m)
+    for k, (key, value) in enumerate(loc_hull.items()):
+        color = colors[-1 - k % len(colors)]
+        cluster = folium.FeatureGroup(name=str(key), show=False).add_to(m)
         x, y = value.exterior.coords.xy
-        transformer = crs_transformer(crs_3116, crs_4686)
         lat, lon = crs_transformation(transformer, x, y)
         pts = np.vstack((np.array(lat), np.array(lon))).T
         cluster.add_child(folium.PolyLine(pts, color=color, weight=2.5, opacity=1))
-        T = loc_tree[key]
-        for i, j in T.edges:
-            latitud_i = df.loc[i, "latitud"]
-            longitud_i = df.loc[i, "longitud"]
-            latitud_j = df.loc[j, "latitud"]
-            longitud_j = df.loc[j, "longitud"]
+        for (lat_i, lon_i), (lat_j, lon_j) in tree_segments(loc_tree[key], df, actual_1, actual_2):
             cluster.add_child(
                 folium.PolyLine(
-                    [(latitud_i, longitud_i), (latitud_j, longitud_j)],
+                    [(lat_i, lon_i), (lat_j, lon_j)],
                     color="black",
                     weight=2.5,
                     opacity=1,
                 )
             )
-        df_aux = df.loc[df['zona']==key].copy()
-        for key, value in df_aux[['latitud','longitud']].iterrows():
-            lat, lon = value
+        df_aux = df.loc[df[column_id]==key, [actual_1, actual_2]]
+        for lat, lon in df_aux.values:
             cluster.add_child(
                 folium.Circle(radius=50, location=[lat, lon], color=color, fill=True)
             )
 
     folium.LayerControl(name="Layer Control", collapsed=True).add_to(m)
-    m.save('maps/' + name + '.html')
+    m.save(os.path.join(path, name + '.html'))
 
 
-def plot_folium_final(loc_hull, loc_tree, df, df_good, df_bad, name):
-    """
+def plot_folium_final(
+    loc_hull, loc_tree, df, df_good, df_bad, name, actual_epsg="epsg:4686",
+    convert_epsg="epsg:3116", column_id="zona", actual_1="latitud",
+    actual_2="longitud", path="maps"
+):
+    """Saves a folium map like plot_folium with good and bad nodes in
+    different colors
+
+    Parameters
+    ----------
+    df_good : pandas.core.frame.DataFrame
+        DataFrame with the good nodes, see ident_good_proj
+    df_bad : pandas.core.frame.DataFrame
+        DataFrame with the bad nodes, see ident_good_proj
+
+    Returns
+    -------
+
+    
     """
-    crs_4686 = "epsg:4686"
-    crs_3116 = "epsg:3116"
-    transformer = crs_transformer(crs_4686, crs_3116)
-    mapa_x, mapa_y = df[["latitud", "longitud"]].mean().values
+    # One transformer from the projected CRS for all the polygons
+    transformer = crs_transformer(convert_epsg, actual_epsg)
+    mapa_x, mapa_y = df[[actual_1, actual_2]].mean().values
     m = folium.Map(location=(mapa_x, mapa_y), zoom_start=12, tiles="cartodbpositron")
     colors = ["chocolate","blue","grey","purple"]
-    for key, value in loc_hull.items():
-        color = colors.pop()
-        cluster = folium.FeatureGroup(name=key, show=False).add_to(m)
+    for k, (key, value) in enumerate(loc_hull.items()):
+        color = colors[-1 - k % len(colors)]
+        cluster = folium.FeatureGroup(name=str(key), show=False).add_to(m)
         x, y = value.exterior.coords.xy
-        transformer = crs_transformer(crs_3116, crs_4686)
         lat, lon = crs_transformation(transformer, x, y)
         pts = np.vstack((np.array(lat), np.array(lon))).T
         cluster.add_child(folium.PolyLine(pts, color=color, weight=2.5, opacity=1))
-        T = loc_tree[key]
-        for i, j in T.edges:
-            latitud_i = df.loc[i, "latitud"]
-            longitud_i = df.loc[i, "longitud"]
-            latitud_j = df.loc[j, "latitud"]
-            longitud_j = df.loc[j, "longitud"]
+        for (lat_i, lon_i), (lat_j, lon_j) in tree_segments(loc_tree[key], df, actual_1, actual_2):
             cluster.add_child(
                 folium.PolyLine(
-                    [(latitud_i, longitud_i), (latitud_j, longitud_j)],
+                    [(lat_i, lon_i), (lat_j, lon_j)],
                     color="black",
                     weight=2.5,
                     opacity=1,
                 )
             )
-        df_aux_good = df_good.loc[df_good['zona']==key].copy()
-        for key_1, value in df_aux_good[['latitud','longitud']].iterrows():
-            lat, lon = value
+        df_aux_good = df_good.loc[df_good[column_id]==key, [actual_1, actual_2]]
+        for lat, lon in df_aux_good.values:
             cluster.add_child(
                 folium.Circle(radius=50, location=[lat, lon], color='lime', fill=True)
             )
-        df_aux_bad = df_bad.loc[df_bad['zona']==key].copy()
-        for key_2, value in df_aux_bad[['latitud','longitud']].iterrows():
-            lat, lon = value
+        df_aux_bad = df_bad.loc[df_bad[column_id]==key, [actual_1, actual_2]]
+        for lat, lon in df_aux_bad.values:
             cluster.add_child(
                 folium.Circle(radius=50, location=[lat, lon], color='red', fill=True)
             )
 
     folium.LayerControl(name="Layer Control", collapsed=True).add_to(m)
-    m.save('maps/' + name + '.html')
+    m.save(os.path.join(path, name + '.html'))
@@ -1,7 +1,9 @@
 # Importamos los paquetes de interes
 import warnings
 import time
+from concurrent.futures import ThreadPoolExecutor
 from shapely.errors import ShapelyDeprecationWarning
+import numpy as np
 import pandas as pd
 # Importamos de nuestro subpaquete los modulos importantes
 from boundaries_algorithm.preprocessing_module import coordinates_projection
@@ -11,6 +13,8 @@ from boundaries_algorithm.validation.validation import (
     smooth_polygons, 
     ident_good_proj
 )
+from boundaries_algorithm.parallel_module import submit_bounded, wait_all
+from boundaries_algorithm.reporting_module import validation_report
 from boundaries_algorithm.visualization_module import plot_folium, plot_folium_final
 
 # Desactivamos los warnings
@@ -31,6 +35,14 @@ convert_2="Y"
 threshold_N = 0.90
 buffer_area = 0.15
 N = 100
+# 0.0 colapsa las coordenadas repetidas en un solo nodo (opcional)
+epsilon = None
+
+# Los mapas de cada etapa se guardan en segundo plano mientras se
+# calculan las siguientes, con a lo sumo dos mapas en espera (hilos,
+# para no volver a ejecutar este script en procesos nuevos)
+pool = ThreadPoolExecutor(max_workers=1)
+pendientes = set()
 
 # Importamos el df
 df = pd.read_csv('data.csv')
@@ -55,10 +67,18 @@ init_loc_hull, init_loc_tree = polygons_init(
     threshold_N=threshold_N,
     buffer_area=buffer_area,
     convert_1=convert_1,
-    convert_2=convert_2
+    convert_2=convert_2,
+    epsilon=epsilon
 )
 
 print(f'Inicialización en \t {round(time.time()-inicio, 2)} segundos.')
+submit_bounded(
+    pool, pendientes, plot_folium,
+    loc_hull=init_loc_hull,
+    loc_tree=init_loc_tree,
+    df=df,
+    name='001_inicializacion'
+)
 inicio = time.time()
 
 # Eliminacion intersecciones
@@ -68,6 +88,13 @@ inter_loc_hull, inter_loc_tree = poly_no_inter(
 )
 
 print(f'Intersecciones en \t {round(time.time()-inicio, 2)} segundos.')
+submit_bounded(
+    pool, pendientes, plot_folium,
+    loc_hull=inter_loc_hull,
+    loc_tree=inter_loc_tree,
+    df=df,
+    name='002_intersecciones'
+)
 time.time()
 
 # Creacion poligonos suaves
@@ -77,6 +104,13 @@ smooth_loc_hull = smooth_polygons(
 )
 
 print(f'Polígonos suaves en \t {round(time.time()-inicio, 2)} segundos.')
+submit_bounded(
+    pool, pendientes, plot_folium,
+    loc_hull=smooth_loc_hull,
+    loc_tree=inter_loc_tree,
+    df=df,
+    name='003_smooth'
+)
 time.time()
 
 # Identify good projects
@@ -89,41 +123,8 @@ df_good, df_bad, percentage = ident_good_proj(
 )
 
 print(f'Validación en \t\t {round(time.time()-inicio, 2)} segundos.')
-time.time()
-
-df['Validado'] = 'NO'
-df.loc[df_good.index, 'Validado'] = 'SI'
-resumen = df.pivot_table(index=['zona'], columns='Validado', aggfunc='size', fill_value='')
-resumen['Validación [%]'] = 100*round(resumen['SI']/(resumen['SI']+resumen['NO']), 4)
-
-print('-'*12+' RESUMEN '+'-'*12)
-print(resumen)
-print('-'*34)
-
-# PLOTS
-
-plot_folium(
-    loc_hull=init_loc_hull,
-    loc_tree=init_loc_tree,
-    df=df,
-    name='001_inicializacion'
-)
-
-plot_folium(
-    loc_hull=inter_loc_hull,
-    loc_tree=inter_loc_tree,
-    df=df,
-    name='002_intersecciones'
-)
-
-plot_folium(
-    loc_hull=smooth_loc_hull,
-    loc_tree=inter_loc_tree,
-    df=df,
-    name='003_smooth'
-)
-
-plot_folium_final(
+submit_bounded(
+    pool, pendientes, plot_folium_final,
     loc_hull=smooth_loc_hull,
     loc_tree=inter_loc_tree,
     df=df,
@@ -131,3 +132,16 @@ plot_folium_final(
     df_bad=df_bad,
     name='004_final'
 )
+
+# Resumen por zona a partir de la mascara de validez
+valido = df.index.isin(df_good.index)
+resumen = validation_report(df, valido, [column_id], smooth_loc_hull)
+
+print('-'*12+' RESUMEN '+'-'*12)
+print(resumen)
+print('-'*34)
+
+# Esperamos a que terminen los mapas antes de modificar el df
+wait_all(pendientes)
+pool.shutdown()
+df['Validado'] = np.where(valido, 'SI', 'NO')
@@ -0,0 +1,31 @@
+import shapely.geometry
+
+from boundaries_algorithm.validation.poly_module import clip_poly_inter, identify_poly_inter
+from boundaries_algorithm.validation.validation import smooth_polygons
+
+
+def covered_zone():
+    # The biggest zone is covered by its two smaller neighbours
+    return {
+        "A": shapely.geometry.box(-1, -1, 5.5, 11),
+        "B": shapely.geometry.box(4.5, -1, 11, 11),
+        "C": shapely.geometry.box(0, 0, 10, 10),
+    }
+
+
+def test_clip_poly_inter_drops_covered_zone():
+    loc_hull = covered_zone()
+    clip_loc_hull = clip_poly_inter(loc_hull, identify_poly_inter(loc_hull))
+    assert set(clip_loc_hull) == {"A", "B"}
+    assert all(hull.geom_type == "Polygon" and hull.area > 0 for hull in clip_loc_hull.values())
+    assert clip_loc_hull["A"].intersection(clip_loc_hull["B"]).area == 0
+    # The input is not modified
+    assert set(loc_hull) == {"A", "B", "C"}
+
+
+def test_smooth_polygons_after_clip():
+    loc_hull = covered_zone()
+    clip_loc_hull = clip_poly_inter(loc_hull, identify_poly_inter(loc_hull))
+    smooth_loc_hull = smooth_polygons(clip_loc_hull, 20)
+    assert set(smooth_loc_hull) == {"A", "B"}
+    assert all(not hull.is_empty for hull in smooth_loc_hull.values())